@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# Benchmarks for header reading, dumping and anonymization, run against
+# synthetic p-files. Results are written as JSON; two result files can be
+# compared to look for regressions.
+
+import json
+import optparse
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pfile_tools
+from pfile_tools import headers, struct_utils, anonymizer, synthetic
+
+SMALL_DATA_SIZE = 1 << 20
+LARGE_DATA_SIZE = 2 << 30
+
+
+def time_it(func, number, repeat):
+    """
+    Calls func number times, repeat times over, and returns per-call
+    timings: the best and median of the repeats.
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    timings.sort()
+    return {
+        "min": timings[0],
+        "median": timings[len(timings) // 2],
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_cli(module, *args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(
+            [sys.executable, "-m", module] + list(args),
+            stdout=devnull, env=env)
+
+
+def library_benchmarks(workdir, revision, number, repeat):
+    path = os.path.join(workdir, "P%s.7" % revision.replace(".", "_"))
+    synthetic.make_pfile(path, revision, SMALL_DATA_SIZE, random.Random(0))
+    pfile = headers.Pfile.from_file(path)
+    a = anonymizer.Anonymizer()
+
+    def mmap_read():
+        with headers.Pfile.from_file(path, use_mmap=True) as p:
+            p.exam_number
+
+    results = {}
+    results["from_file[%s]" % revision] = time_it(
+        lambda: headers.Pfile.from_file(path), number, repeat)
+    results["from_file_mmap[%s]" % revision] = time_it(
+        mmap_read, number, repeat)
+    results["dump_struct[%s]" % revision] = time_it(
+        lambda: struct_utils.dump_struct(pfile.header), number, repeat)
+    results["anonymize[%s]" % revision] = time_it(
+        lambda: a.anonymize(pfile.header), number, repeat)
+    return results
+
+
+def cli_benchmarks(workdir, revision, data_size, label, repeat):
+    path = os.path.join(workdir, "P%s_%s.7" % (revision.replace(".", "_"), label))
+    out = os.path.join(workdir, "anon_%s.7" % label)
+    synthetic.make_pfile(path, revision, data_size, random.Random(0))
+    results = {}
+    results["cli_dump_pfile_header[%s,%s]" % (revision, label)] = time_it(
+        lambda: run_cli("pfile_tools.scripts.dump_pfile_header", path),
+        1, repeat)
+    results["cli_anonymize_pfile[%s,%s]" % (revision, label)] = time_it(
+        lambda: run_cli("pfile_tools.scripts.anonymize_pfile", path, out),
+        1, repeat)
+    os.remove(path)
+    os.remove(out)
+    return results
+
+
+def run(options):
+    workdir = tempfile.mkdtemp(prefix="pfile_bench_", dir=options.workdir)
+    results = {}
+    try:
+        for revision in headers.known_revisions():
+            results.update(library_benchmarks(
+                workdir, revision, options.number, options.repeat))
+        # The CLIs are timed on the newest revision only; they start a
+        # whole interpreter, so the header format hardly matters.
+        revision = headers.known_revisions()[-1]
+        sizes = [(SMALL_DATA_SIZE, "small")]
+        if not options.quick:
+            sizes.append((LARGE_DATA_SIZE, "large"))
+        for data_size, label in sizes:
+            results.update(cli_benchmarks(
+                workdir, revision, data_size, label, options.cli_repeat))
+    finally:
+        shutil.rmtree(workdir)
+    return {
+        "meta": {
+            "pfile_tools": pfile_tools.VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(old, new, threshold):
+    """
+    Prints the change in median time for each benchmark in both runs, and
+    returns the names of those that got slower by more than threshold
+    (a fraction).
+    """
+    regressions = []
+    names = sorted(set(old["results"]) & set(new["results"]))
+    for name in names:
+        before = old["results"][name]["median"]
+        after = new["results"][name]["median"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-45s %12.6f %12.6f %+8.1f%%%s" % (
+            name, before, after, change * 100, flag))
+    return regressions
+
+
+def build_option_parser():
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS]\n"
+            "       %prog --compare old.json new.json",
+        description="Benchmarks pfile-tools against synthetic p-files.")
+    p.add_option("-o", "--output", action="store", default=None,
+        help="Write results to this JSON file (default: stdout)")
+    p.add_option("-n", "--number", action="store", type="int", default=100,
+        help="Calls per timing for library benchmarks (default: 100)")
+    p.add_option("--repeat", action="store", type="int", default=5,
+        help="Timings per library benchmark (default: 5)")
+    p.add_option("--cli-repeat", action="store", type="int", default=3,
+        help="Timings per command-line benchmark (default: 3)")
+    p.add_option("--quick", action="store_true", default=False,
+        help="Skip the multi-GB file benchmarks")
+    p.add_option("--workdir", action="store", default=None,
+        help="Where to make the test files (default: the temp directory)")
+    p.add_option("--compare", action="store_true", default=False,
+        help="Compare two result files instead of running benchmarks")
+    p.add_option("--threshold", action="store", type="float", default=0.1,
+        help="Slowdown that counts as a regression, as a fraction "
+            "(default: 0.1)")
+    return p
+
+
+def main():
+    parser = build_option_parser()
+    options, args = parser.parse_args()
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare needs two result files")
+        with open(args[0]) as f:
+            old = json.load(f)
+        with open(args[1]) as f:
+            new = json.load(f)
+        if compare(old, new, options.threshold):
+            sys.exit(1)
+        return
+    results = run(options)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
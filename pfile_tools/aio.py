@@ -0,0 +1,62 @@
+# Part of the pfile-tools package
+# asyncio helpers for reading lots of p-file headers from slow storage.
+
+import asyncio
+from collections import namedtuple
+from concurrent import futures
+
+from pfile_tools import headers
+
+# pfile is None, and error is the exception, if reading failed.
+ReadResult = namedtuple("ReadResult", ["path", "pfile", "error"])
+
+
+async def iter_pfiles(paths, concurrency=32, force_revision=None,
+        use_mmap=False, memoize=False, return_exceptions=False):
+    """
+    Reads many p-file headers concurrently, yielding ReadResults in the
+    order reads finish. Reads happen in a pool of concurrency threads, and
+    only about that many paths are taken from paths at a time, so it can
+    be a long iterator.
+
+    If a read fails, the exception is raised, unless return_exceptions is
+    true -- then it's returned in the result instead.
+
+    The other arguments are as for Pfile.from_file. If use_mmap is true,
+    close each Pfile when you're done with it.
+    """
+    paths = iter(paths)
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    async def read(path):
+        try:
+            pfile = await headers.Pfile.afrom_file(
+                path, force_revision=force_revision, use_mmap=use_mmap,
+                memoize=memoize, executor=executor)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return ReadResult(path, None, e)
+        return ReadResult(path, pfile, None)
+
+    def fill(pending):
+        # Keep one extra batch queued so threads never wait on us.
+        while len(pending) < concurrency * 2:
+            path = next(paths, None)
+            if path is None:
+                return
+            pending.add(asyncio.ensure_future(read(path)))
+
+    pending = set()
+    try:
+        fill(pending)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+            fill(pending)
+    finally:
+        for task in pending:
+            task.cancel()
+        executor.shutdown(wait=False)
@@ -3,9 +3,15 @@
 # Written by Nathan Vack <njvack@wisc.edu>
 # A library for performing anonymization of GE p-file headers.
 
+import ctypes
+import mmap
+import os
+import shutil
+import time
 from collections import namedtuple
 
-import struct_utils
+from pfile_tools import (
+    compression, headers, instrumentation, io_utils, struct_utils)
 import logging
 logger = logging.getLogger(__name__)
 
@@ -13,6 +19,12 @@ logger = logging.getLogger(__name__)
 AnonEntry = namedtuple("AnonEntry",
     ["key", "value", "option_name", "description"])
 
+# Changed header ranges closer than this are written together.
+WRITE_GAP = 512
+
+# Bytes copied at a time when streaming the data after a header.
+STREAM_BUFSIZE = 1 << 20
+
 # Note: key and option_name should be unique in the list.
 DEFAULT_LIST = [
     AnonEntry("patient_name",     "ANONYMIZED", "name",        "patient name"),
@@ -38,19 +50,196 @@ class Anonymizer(object):
             See DEFAULT_LIST for examples. Defaults to DEFAULT_LIST.
         """
         self.anonymization_list = anonymization_list
+        self._patches = {}
 
-    def anonymize(self, header):
+    @instrumentation.timed("anonymizer.anonymize")
+    def anonymize(self, header, dirty=None):
         """Runs through self.anonymization_list and anonymizes the header
         in place.
 
         Arguments:
         header -- a pfile header. NOTE: This structure will be modified
             in place!
+        dirty -- an optional struct_utils.DirtyRanges, which will record
+            the byte ranges of every field that's changed.
         """
         logger.debug("Working with a %s" % (type(header)))
         for entry in self.anonymization_list:
             if struct_utils.has_struct_value(header, entry.key):
                 logger.debug("Setting %s to %s" % (entry.key, entry.value))
-                struct_utils.set_struct_value(header, entry.key, entry.value)
+                struct_utils.set_struct_value(
+                    header, entry.key, entry.value, dirty)
             else:
                 logger.debug("%s not found in header" % entry.key)
+
+    def patches(self, header_cls):
+        """Returns this anonymization as a list of (offset, bytes) patches
+        for headers of class header_cls. Anonymized fields don't depend on
+        their old values, so the same patches work for every header of a
+        revision; they're computed once per class.
+        """
+        patches = self._patches.get(header_cls)
+        if patches is None:
+            scratch = header_cls()
+            dirty = struct_utils.DirtyRanges()
+            self.anonymize(scratch, dirty)
+            view = memoryview(scratch).cast('B')
+            # No gap here: the bytes between ranges aren't ours to write.
+            patches = [(start, bytes(view[start:end]))
+                for start, end in dirty.coalesced()]
+            self._patches[header_cls] = patches
+        return patches
+
+
+def anonymize_file(pfile_in, pfile_out=None, anon=None, force_revision=None,
+        copy_mode="offload", compress=None, level=None, threads=None):
+    """Anonymizes a p-file, writing the result to pfile_out, or back to
+    pfile_in if pfile_out is None.
+
+    Arguments:
+    anon -- the Anonymizer to use; defaults to one using DEFAULT_LIST
+    force_revision -- a header revision to use instead of detecting it
+    copy_mode -- how to make pfile_out: "offload" copies with
+        io_utils.copy_file() and then writes only the changed header
+        bytes; "full" copies normally and rewrites the whole header.
+    compress -- a codec (see compression.CODECS) to compress pfile_out
+        with, as it's written; the input is read just once
+    level -- the compression level
+    threads -- the number of compression threads; defaults to the number
+        of CPUs
+
+    Compressed p-files are decompressed, anonymized and compressed again
+    (with the same codec, unless compress says otherwise) in one pass; they
+    can't be anonymized in place.
+
+    Returns the list of (start, end) header ranges written.
+    """
+    anon = anon or Anonymizer()
+    codec = compression.codec_of(pfile_in)
+    if codec is not None and pfile_out is None:
+        raise ValueError(
+            "Can't anonymize %s in place; it's compressed with %s" % (
+                pfile_in, codec))
+    compress = compress or codec
+    if compress is not None:
+        if pfile_out is None:
+            raise ValueError("Can't compress %s in place" % pfile_in)
+        logger.debug("Anonymizing %s to %s, compressed with %s" % (
+            pfile_in, pfile_out, compress))
+        with compression.open_pfile(pfile_in) as instream:
+            with io_utils.replacing(pfile_out) as f:
+                with compression.ParallelCompressWriter(
+                        f, compress, level, threads) as outstream:
+                    pfile = anonymize_stream(
+                        instream, outstream, anon, force_revision)
+        return [(0, len(memoryview(pfile.header).cast('B')))]
+    pfile = headers.Pfile.from_file(pfile_in, force_revision=force_revision)
+    dirty = struct_utils.DirtyRanges()
+    anon.anonymize(pfile.header, dirty)
+    if pfile_out is None:
+        pfile_out = pfile_in
+    elif copy_mode == "full":
+        logger.debug("Copying %s to %s" % (pfile_in, pfile_out))
+        shutil.copyfile(pfile_in, pfile_out)
+        with instrumentation.timed("anonymizer.write_header"):
+            with open(pfile_out, "r+b") as f:
+                f.write(pfile.header)
+        return [(0, len(memoryview(pfile.header).cast('B')))]
+    else:
+        method = io_utils.copy_file(pfile_in, pfile_out)
+        logger.debug("Copied %s to %s with %s" % (pfile_in, pfile_out, method))
+    ranges = dirty.coalesced(WRITE_GAP)
+    logger.debug("Writing changed header ranges %s" % (ranges,))
+    with instrumentation.timed("anonymizer.write_header"):
+        with open(pfile_out, "r+b") as f:
+            io_utils.write_ranges(f, pfile.header, ranges)
+    return ranges
+
+
+def anonymize_stream(instream, outstream, anon=None, force_revision=None,
+        bufsize=STREAM_BUFSIZE):
+    """Reads a p-file from instream and writes it, anonymized, to
+    outstream: the header, then the data, copied through a single bufsize
+    buffer so memory use stays constant. Neither stream needs to be
+    seekable, so this works for pipes and compressed files. Returns the
+    anonymized Pfile.
+    """
+    anon = anon or Anonymizer()
+    pfile = headers.Pfile.from_file(instream, force_revision=force_revision)
+    anon.anonymize(pfile.header)
+    with instrumentation.timed("anonymizer.write_header"):
+        outstream.write(pfile.header)
+    with instrumentation.timed("anonymizer.copy_data"):
+        io_utils.copy_stream(instream, outstream, bufsize)
+    return pfile
+
+
+class PatchStats(namedtuple("PatchStats",
+        ["files", "failed", "bytes_written", "seconds"])):
+    """Totals from anonymize_inplace()."""
+
+    __slots__ = ()
+
+    @property
+    def files_per_second(self):
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_written / self.seconds if self.seconds else 0.0
+
+
+def anonymize_inplace(paths, anon=None, force_revision=None):
+    """Anonymizes many p-files in place, by mapping each file and applying
+    anon.patches() for its revision directly to the mapping -- no header
+    structs are built and nothing but the patched bytes is written. Files
+    that can't be anonymized are logged and counted as failures.
+
+    Arguments:
+    paths -- an iterable of p-file paths
+    anon -- the Anonymizer to use; defaults to one using DEFAULT_LIST
+    force_revision -- a header revision to use instead of detecting it
+
+    Returns a PatchStats.
+    """
+    anon = anon or Anonymizer()
+    files = failed = written = 0
+    start = time.time()
+    for path in paths:
+        try:
+            written += patch_file(path, anon, force_revision)
+            files += 1
+        except (EnvironmentError, ValueError, headers.UnknownRevision) as e:
+            logger.error("%s: %s" % (path, e))
+            failed += 1
+    return PatchStats(files, failed, written, time.time() - start)
+
+
+@instrumentation.timed("anonymizer.patch_file")
+def patch_file(path, anon, force_revision=None):
+    """Applies anon's patches to one p-file in place, through a memory
+    mapping. Returns the number of bytes written.
+    """
+    with open(path, "r+b") as f:
+        # Map just the header, not gigabytes of data.
+        if force_revision:
+            length = ctypes.sizeof(headers.header_class(force_revision))
+        else:
+            length = headers.max_header_size()
+        length = min(os.fstat(f.fileno()).st_size, length)
+        if length == 0:
+            raise ValueError("File is empty")
+        mapped = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_WRITE)
+    try:
+        revision = force_revision or headers.sniff_revision(mapped)
+        header_cls = headers.header_class(revision)
+        if len(mapped) < ctypes.sizeof(header_cls):
+            raise ValueError(
+                "File is too short for a revision %s header" % revision)
+        written = 0
+        for offset, data in anon.patches(header_cls):
+            mapped[offset:offset+len(data)] = data
+            written += len(data)
+        return written
+    finally:
+        mapped.close()
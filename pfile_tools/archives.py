@@ -0,0 +1,252 @@
+# Part of the pfile-tools package
+# Reads p-file headers straight out of tar and zip archives, without
+# extracting anything.
+#
+# Tar archives are read in one sequential pass: each p-file's header is
+# parsed from the member's stream, and its data is skipped -- by seeking
+# where the archive allows it, by reading past it otherwise (eg, on a pipe).
+# Zip archives need to be seekable, and each member is opened on its own.
+#
+# anonymize_tar() rewrites a tar archive the same way: one pass in, one pass
+# out, with only the p-file headers changed.
+
+import ctypes
+import fnmatch
+import posixpath
+import tarfile
+import zipfile
+from collections import namedtuple
+
+from pfile_tools import anonymizer, compression, headers, scanner
+import logging
+logger = logging.getLogger(__name__)
+
+# pfile is None if reading the member failed, in which case error is a
+# description of what went wrong.
+ArchiveMember = namedtuple("ArchiveMember", ["name", "pfile", "error"])
+
+
+def iter_archive_pfiles(archive, pattern=scanner.DEFAULT_PATTERN,
+        force_revision=None):
+    """
+    Yields an ArchiveMember for each p-file in a tar or zip archive: each
+    regular file whose name (without its directory) matches pattern, or
+    pattern plus a compressed suffix (see scanner.COMPRESSED_SUFFIXES).
+    Members that can't be read are yielded with an error, so one bad file
+    doesn't stop the scan.
+
+    Members can be compressed (see pfile_tools.compression); so can tar
+    archives. The Pfiles have no path, as their data can't be mapped.
+
+    Arguments:
+    archive -- a filename, or an open binary file; tar archives needn't be
+        seekable
+    pattern -- filename pattern for p-files
+    force_revision -- a header revision to use instead of detecting it
+    """
+    if hasattr(archive, 'read'):
+        return _iter_archive_file(archive, pattern, force_revision)
+    return _iter_archive_path(archive, pattern, force_revision)
+
+
+def scan_archive(archive, pattern=scanner.DEFAULT_PATTERN,
+        force_revision=None, fields=None, include_padding=False):
+    """
+    Like scanner.scan(), but for the p-files in one archive; yields
+    ScanResults, in archive order, with paths like archive.tar:member.
+    Other arguments are as for iter_archive_pfiles() and
+    scanner.scan_header().
+    """
+    archive_name = getattr(archive, 'name', archive)
+    if not isinstance(archive_name, str):
+        archive_name = "-"
+    for member in iter_archive_pfiles(archive, pattern, force_revision):
+        path = "%s:%s" % (archive_name, member.name)
+        if member.error is not None:
+            yield scanner.ScanResult(path, None, [], member.error)
+            continue
+        values = scanner.header_values(member.pfile, fields, include_padding)
+        yield scanner.ScanResult(path, member.pfile.revision, values, None)
+
+
+def anonymize_tar(src, dst, anon=None, pattern=scanner.DEFAULT_PATTERN,
+        force_revision=None, bufsize=anonymizer.STREAM_BUFSIZE):
+    """
+    Copies the tar archive src to dst, anonymizing the header of each p-file
+    (each regular file whose name matches pattern, as for
+    iter_archive_pfiles()) on the way through.
+    Everything else, and the p-files' data, is copied unchanged, bufsize
+    bytes at a time. Neither needs to be seekable; src may be compressed,
+    and dst is written uncompressed (pass a
+    compression.ParallelCompressWriter to compress it).
+
+    A member that matches pattern but can't be anonymized -- it isn't a
+    p-file we can read, or it's compressed -- raises ValueError rather than
+    being copied with its patient information intact.
+
+    Arguments:
+    src, dst -- filenames, or open binary files
+    anon -- the Anonymizer to use; defaults to one using DEFAULT_LIST
+
+    Returns the names of the members anonymized.
+    """
+    anon = anon or anonymizer.Anonymizer()
+    if hasattr(src, 'read'):
+        tar_in = tarfile.open(fileobj=src, mode='r|*')
+    else:
+        tar_in = tarfile.open(src, 'r|*')
+    with tar_in:
+        if hasattr(dst, 'write'):
+            tar_out = tarfile.open(
+                fileobj=dst, mode='w|', copybufsize=bufsize,
+                format=tarfile.PAX_FORMAT)
+        else:
+            tar_out = tarfile.open(
+                dst, 'w|', copybufsize=bufsize, format=tarfile.PAX_FORMAT)
+        with tar_out:
+            return _anonymize_members(
+                tar_in, tar_out, anon, pattern, force_revision)
+
+
+def _anonymize_members(tar_in, tar_out, anon, pattern, force_revision):
+    anonymized = []
+    while True:
+        info = tar_in.next()
+        if info is None:
+            return anonymized
+        tar_in.members = []
+        if not info.isfile():
+            tar_out.addfile(info)
+            continue
+        member_file = tar_in.extractfile(info)
+        if not _matches(info.name, pattern):
+            tar_out.addfile(info, member_file)
+            continue
+        logger.debug("Anonymizing %s" % info.name)
+        tar_out.addfile(info, _anonymized_member(
+            info, member_file, anon, force_revision))
+        anonymized.append(info.name)
+
+
+def _anonymized_member(info, member_file, anon, force_revision):
+    """
+    Returns a file that reads as member_file with its header anonymized.
+    """
+    stream, codec = compression.open_stream(member_file)
+    if codec is not None:
+        raise ValueError("Can't anonymize %s; it's compressed with %s" % (
+            info.name, codec))
+    try:
+        pfile = headers.Pfile.from_file(stream, force_revision=force_revision)
+    except headers.UnknownRevision as e:
+        raise ValueError("Can't anonymize %s: %s" % (info.name, e))
+    if ctypes.sizeof(pfile.header) > info.size:
+        raise ValueError(
+            "%s is too short for a revision %s header" % (
+                info.name, pfile.revision))
+    anon.anonymize(pfile.header)
+    return _ChainReader(memoryview(pfile.header).cast('B'), stream)
+
+
+class _ChainReader(object):
+    """
+    Reads the bytes in head, then the rest of the file rest. Reads are
+    always as long as asked for, until the data runs out, which tarfile
+    counts on.
+    """
+
+    def __init__(self, head, rest):
+        self.head = head
+        self.rest = rest
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.rest.read(size)
+        if size < 0:
+            size = len(self.head)
+            data = bytes(self.head) + self.rest.read()
+            self.head = self.head[size:]
+            return data
+        chunk = bytes(self.head[:size])
+        self.head = self.head[len(chunk):]
+        if len(chunk) < size:
+            chunk += self.rest.read(size - len(chunk))
+        return chunk
+
+
+def _iter_archive_path(path, pattern, force_revision):
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for member in _iter_zip(zf, pattern, force_revision):
+                yield member
+        return
+    with tarfile.open(path, 'r:*') as tar:
+        for member in _iter_tar(tar, pattern, force_revision):
+            yield member
+
+
+def _iter_archive_file(fileobj, pattern, force_revision):
+    seekable = hasattr(fileobj, 'seekable') and fileobj.seekable()
+    if seekable:
+        start = fileobj.tell()
+        is_zip = zipfile.is_zipfile(fileobj)
+        fileobj.seek(start)
+        if is_zip:
+            with zipfile.ZipFile(fileobj) as zf:
+                for member in _iter_zip(zf, pattern, force_revision):
+                    yield member
+            return
+    mode = 'r:*' if seekable else 'r|*'
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for member in _iter_tar(tar, pattern, force_revision):
+            yield member
+
+
+def _iter_tar(tar, pattern, force_revision):
+    while True:
+        info = tar.next()
+        if info is None:
+            return
+        # The TarFile remembers every member it's seen; with hundreds of
+        # thousands of them, that adds up. We never look back.
+        tar.members = []
+        if info.isfile() and _matches(info.name, pattern):
+            yield _read_member(
+                info.name, tar.extractfile(info), force_revision)
+
+
+def _iter_zip(zf, pattern, force_revision):
+    for info in zf.infolist():
+        if info.is_dir() or not _matches(info.filename, pattern):
+            continue
+        try:
+            member_file = zf.open(info)
+        except Exception as e:
+            yield _error(info.filename, e)
+            continue
+        yield _read_member(info.filename, member_file, force_revision)
+
+
+def _read_member(name, member_file, force_revision):
+    try:
+        with member_file:
+            stream, codec = compression.open_stream(member_file)
+            pfile = headers.Pfile.from_file(
+                stream, force_revision=force_revision)
+    except Exception as e:
+        return _error(name, e)
+    # Member streams are named for the archive, which isn't the p-file.
+    pfile.path = None
+    return ArchiveMember(name, pfile, None)
+
+
+def _error(name, e):
+    logger.debug("%s: %s" % (name, e))
+    return ArchiveMember(name, None, "%s: %s" % (type(e).__name__, e))
+
+
+def _matches(name, pattern):
+    # Compressed members are recognized by their contents, when they're read.
+    name = posixpath.basename(name)
+    return (fnmatch.fnmatch(name, pattern)
+        or scanner.matches_compressed(name, pattern))
@@ -0,0 +1,153 @@
+# Part of the pfile-tools package
+# Anonymizes whole directory trees of p-files in parallel, keeping a
+# journal so interrupted runs can pick up where they left off.
+
+import os
+import re
+from collections import namedtuple
+
+from pfile_tools import anonymizer, scanner
+import logging
+logger = logging.getLogger(__name__)
+
+# skipped is true for files the journal says were already done; error is
+# None unless anonymizing failed.
+BatchResult = namedtuple("BatchResult", ["src", "dst", "skipped", "error"])
+
+
+class Journal(object):
+    """
+    An append-only record of the files a batch has finished, one line per
+    file: relative path, size and mtime_ns of the source, tab-separated.
+    Tabs, newlines and backslashes in paths are backslash-escaped. A file
+    is only done if it's in the journal and the source hasn't changed
+    since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            self._load()
+        self.f = open(path, "a", encoding="utf-8", errors="surrogateescape")
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # A partial last line just means we died mid-write. Cut it off,
+            # so the next record starts on a line of its own.
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                logger.debug("Dropping partial journal line %r" % data[end:])
+                f.truncate(end)
+        text = data[:end].decode("utf-8", "surrogateescape")
+        for line in text.split("\n")[:-1]:
+            parts = line.split("\t")
+            if len(parts) == 3:
+                self.done[_unescape(parts[0])] = (int(parts[1]), int(parts[2]))
+
+    def is_done(self, relpath, st):
+        return self.done.get(relpath) == (st.st_size, st.st_mtime_ns)
+
+    def record(self, relpath, st):
+        self.f.write("%s\t%d\t%d\n" % (
+            _escape(relpath), st.st_size, st.st_mtime_ns))
+        self.f.flush()
+        self.done[relpath] = (st.st_size, st.st_mtime_ns)
+
+    def close(self):
+        self.f.close()
+
+
+_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+
+
+def _escape(relpath):
+    return re.sub(r"[\\\t\n\r]", lambda m: _ESCAPES[m.group()], relpath)
+
+
+def _unescape(field):
+    return re.sub(r"\\(.)", lambda m: _UNESCAPES.get(m.group(1), m.group(1)),
+        field)
+
+
+def anonymize_tree(src_root, dst_root, anon=None, workers=None,
+        journal_path=None, pattern=scanner.DEFAULT_PATTERN,
+        force_revision=None, copy_mode="offload"):
+    """
+    Anonymizes every p-file under src_root into the same relative place
+    under dst_root, in a process pool, yielding a BatchResult per file as
+    it finishes.
+
+    Each output is written to a temporary file next to its destination,
+    synced, and renamed into place, so dst_root never holds a partial
+    p-file. If journal_path is given, finished files are recorded there,
+    and files already recorded (and unchanged) are skipped; rerun with the
+    same journal to resume an interrupted batch.
+
+    Arguments:
+    anon -- the Anonymizer to use; defaults to one using DEFAULT_LIST
+    workers -- number of processes; defaults to the number of CPUs
+    pattern -- filename pattern for p-files
+    force_revision, copy_mode -- as for anonymizer.anonymize_file()
+    """
+    anon = anon or anonymizer.Anonymizer()
+    journal = Journal(journal_path) if journal_path else None
+    # Files that never go to the pool (already done, or unreadable); the
+    # pool pulls jobs lazily, so these are handed back between its results.
+    early = []
+    stats = {}
+
+    def jobs():
+        for src in scanner.find_pfiles([src_root], pattern):
+            relpath = os.path.relpath(src, src_root)
+            dst = os.path.join(dst_root, relpath)
+            try:
+                st = os.stat(src)
+            except OSError as e:
+                early.append(BatchResult(src, dst, False, str(e)))
+                continue
+            if journal and journal.is_done(relpath, st):
+                early.append(BatchResult(src, dst, True, None))
+                continue
+            stats[src] = st
+            yield (src, dst, anon, force_revision, copy_mode)
+
+    try:
+        for result in scanner.pool_map(anonymize_one, jobs(), workers):
+            while early:
+                yield early.pop(0)
+            st = stats.pop(result.src)
+            if journal and result.error is None:
+                journal.record(os.path.relpath(result.src, src_root), st)
+            yield result
+        while early:
+            yield early.pop(0)
+    finally:
+        if journal:
+            journal.close()
+
+
+def anonymize_one(src, dst, anon, force_revision=None, copy_mode="offload"):
+    """
+    Anonymizes src to dst atomically, via a temporary file, and returns a
+    BatchResult. Errors are caught and returned in the result.
+    """
+    tmp = os.path.join(
+        os.path.dirname(dst), ".%s.anonymizing" % os.path.basename(dst))
+    try:
+        dst_dir = os.path.dirname(dst)
+        if dst_dir and not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir, exist_ok=True)
+        anonymizer.anonymize_file(
+            src, tmp, anon, force_revision=force_revision,
+            copy_mode=copy_mode)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, dst)
+        return BatchResult(src, dst, False, None)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return BatchResult(src, dst, False, "%s: %s" % (type(e).__name__, e))
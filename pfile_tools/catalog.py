@@ -0,0 +1,179 @@
+# Part of the pfile-tools package
+# A SQLite catalog of p-file headers, which only re-reads files that
+# have changed since they were last cataloged.
+
+import os
+import sqlite3
+from collections import namedtuple
+
+from pfile_tools import scanner
+import logging
+logger = logging.getLogger(__name__)
+
+UpdateStats = namedtuple("UpdateStats",
+    ["added", "updated", "unchanged", "removed", "failed"])
+
+
+class Catalog(object):
+    """
+    A catalog of p-file headers, stored in a SQLite database. Each file
+    gets one row in the 'pfiles' table, keyed by path, with the file's
+    size, mtime, revision, and a column for each header field. Columns
+    are added as new fields turn up.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pfiles ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "revision TEXT, error TEXT)")
+        self._columns = set(
+            row["name"] for row in self.db.execute("PRAGMA table_info(pfiles)"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, paths, pattern=scanner.DEFAULT_PATTERN, workers=None,
+            force_revision=None, prune=False, batch_size=1000):
+        """
+        Brings the catalog up to date with the p-files in paths (files or
+        directories; see scanner.find_pfiles()). Files whose size and mtime
+        match the catalog are only stat()ed; the rest are read in parallel.
+        Files that can't be read are cataloged with an error, and aren't
+        retried until they change.
+
+        If prune is true, cataloged files under paths that no longer exist
+        are removed.
+
+        Returns an UpdateStats.
+        """
+        roots = [os.path.abspath(p) for p in paths]
+        known = dict(
+            (row["path"], (row["size"], row["mtime_ns"], row["revision"]))
+            for row in self.db.execute(
+                "SELECT path, size, mtime_ns, revision FROM pfiles"))
+        seen = set()
+        to_scan = {}
+        unchanged = failed = 0
+        for path in scanner.find_pfiles(roots, pattern):
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                logger.error("Can't stat %s: %s" % (path, e))
+                failed += 1
+                continue
+            prev = known.get(path)
+            if (prev is not None and prev[:2] == (st.st_size, st.st_mtime_ns)
+                    and force_revision in (None, prev[2])):
+                unchanged += 1
+                continue
+            to_scan[path] = st
+        logger.debug("%d files to read" % len(to_scan))
+
+        added = updated = 0
+        batch = []
+        for result in scanner.scan(
+                to_scan, workers=workers, force_revision=force_revision):
+            if result.error is not None:
+                logger.error("%s: %s" % (result.path, result.error))
+                failed += 1
+            elif result.path in known:
+                updated += 1
+            else:
+                added += 1
+            batch.append((result, to_scan[result.path]))
+            if len(batch) >= batch_size:
+                self._store(batch)
+                batch = []
+        self._store(batch)
+
+        removed = 0
+        if prune:
+            gone = [path for path in known
+                if path not in seen and _is_under(path, roots)]
+            with self.db:
+                self.db.executemany(
+                    "DELETE FROM pfiles WHERE path = ?", [(p,) for p in gone])
+            removed = len(gone)
+        return UpdateStats(added, updated, unchanged, removed, failed)
+
+    def _store(self, batch):
+        if not batch:
+            return
+        with self.db:
+            for result, st in batch:
+                row = {}
+                for label, value in result.values:
+                    if isinstance(value, bytes):
+                        value = value.decode('latin-1')
+                    row[label] = value
+                # The header's own revision float gives way to the
+                # formatted one here.
+                row.update({
+                    "path": result.path,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "revision": result.revision,
+                    "error": result.error,
+                })
+                self._add_columns(row)
+                names = list(row)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO pfiles (%s) VALUES (%s)" % (
+                        ", ".join(_quote(n) for n in names),
+                        ", ".join("?" * len(names))),
+                    [row[n] for n in names])
+
+    def _add_columns(self, names):
+        for name in names:
+            if name not in self._columns:
+                self.db.execute(
+                    "ALTER TABLE pfiles ADD COLUMN %s" % _quote(name))
+                self._columns.add(name)
+
+    def columns(self):
+        """
+        Returns the names of the catalog's columns.
+        """
+        return [row["name"] for row in
+            self.db.execute("PRAGMA table_info(pfiles)")]
+
+    def query(self, where=None, params=(), columns=None, order_by="path"):
+        """
+        Yields cataloged files as dicts.
+
+        Arguments:
+        where -- an SQL expression to filter on, with ? placeholders; eg
+            "psd_name = ? AND tr > ?"
+        params -- values for the placeholders in where
+        columns -- the columns to return (default: all)
+        order_by -- an SQL ORDER BY expression
+        """
+        sql = "SELECT %s FROM pfiles" % (
+            ", ".join(_quote(c) for c in columns) if columns else "*")
+        if where:
+            sql += " WHERE %s" % where
+        if order_by:
+            sql += " ORDER BY %s" % order_by
+        for row in self.db.execute(sql, params):
+            yield dict(zip(row.keys(), row))
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _is_under(path, roots):
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
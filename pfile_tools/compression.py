@@ -0,0 +1,281 @@
+# Part of the pfile-tools package
+# Reading and writing compressed p-files. Compression is recognized by the
+# file's first few bytes, not its name. gzip, bz2 and xz are built in;
+# zstd needs the zstandard package.
+
+import bz2
+import collections
+import gzip
+import io
+import lzma
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = ["gzip", "bz2", "xz", "zstd"]
+
+# Uncompressed p-files start with a float revision number; none of the
+# known ones look like any of these.
+_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+MAGIC_SIZE = max(len(magic) for magic, codec in _MAGIC)
+
+# Data compressed at a time by ParallelCompressWriter.
+BLOCK_SIZE = 4 << 20
+
+# Each codec's default level, as its command-line tool has it.
+DEFAULT_LEVELS = {"gzip": 6, "bz2": 9, "xz": 6, "zstd": 3}
+
+
+def detect(prefix):
+    """
+    Returns the codec of data starting with prefix (at least MAGIC_SIZE
+    bytes, if there are that many), or None if it isn't compressed.
+    """
+    prefix = bytes(prefix[:MAGIC_SIZE])
+    for magic, codec in _MAGIC:
+        if prefix.startswith(magic):
+            return codec
+    return None
+
+
+def available(codec):
+    """
+    Whether codec (one of CODECS) can be used here.
+    """
+    return codec in CODECS and (codec != "zstd" or zstandard is not None)
+
+
+def codec_of(path):
+    """
+    Returns the codec the file at path is compressed with, or None.
+    """
+    with open(path, 'rb') as f:
+        return detect(f.read(MAGIC_SIZE))
+
+
+def open_read(path):
+    """
+    Opens path for reading, decompressing it as it's read if it's
+    compressed. Returns (file, codec); codec is None for plain files, which
+    are returned as ordinary open files.
+
+    Only as much is decompressed as is read, so reading a header from a
+    huge compressed file is cheap.
+    """
+    f = open(path, 'rb')
+    try:
+        codec = detect(f.peek(MAGIC_SIZE))
+    except:
+        f.close()
+        raise
+    if codec is None:
+        return f, None
+    f.close()
+    return open_compressed(path, codec, 'rb'), codec
+
+
+def open_stream(fileobj):
+    """
+    Like open_read(), but for an open binary stream, which needn't be
+    seekable. Returns (stream, codec); if it isn't compressed, fileobj itself
+    is returned. Closing the returned stream doesn't close fileobj.
+    """
+    if not hasattr(fileobj, 'peek'):
+        fileobj = io.BufferedReader(_Unclosing(fileobj))
+    codec = detect(fileobj.peek(MAGIC_SIZE))
+    if codec is None:
+        return fileobj, None
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode='rb'), codec
+    if codec == "bz2":
+        return bz2.BZ2File(fileobj, 'rb'), codec
+    if codec == "xz":
+        return lzma.LZMAFile(fileobj, 'rb'), codec
+    _require_zstandard()
+    return zstandard.ZstdDecompressor().stream_reader(
+        fileobj, closefd=False, read_across_frames=True), codec
+
+
+def open_pfile(path):
+    """
+    Opens path for reading, decompressing it if it's compressed.
+    """
+    return open_read(path)[0]
+
+
+def open_compressed(path, codec, mode='wb', level=None):
+    """
+    Opens path for reading ('rb') or writing ('wb') with codec, one of
+    CODECS. level is the compression level, or None for the codec's default.
+    """
+    if codec == "gzip":
+        if level is None:
+            return gzip.open(path, mode)
+        return gzip.open(path, mode, compresslevel=level)
+    if codec == "bz2":
+        if level is None:
+            return bz2.open(path, mode)
+        return bz2.open(path, mode, compresslevel=level)
+    if codec == "xz":
+        if mode.startswith('r'):
+            return lzma.open(path, mode)
+        return lzma.open(path, mode, preset=level)
+    if codec == "zstd":
+        _require_zstandard()
+        f = open(path, mode)
+        try:
+            if mode.startswith('r'):
+                return zstandard.ZstdDecompressor().stream_reader(
+                    f, closefd=True, read_across_frames=True)
+            return zstandard.ZstdCompressor(
+                level=3 if level is None else level).stream_writer(
+                    f, closefd=True)
+        except:
+            f.close()
+            raise
+    raise ValueError("Unknown codec: %s (available: %s)" % (
+        codec, ", ".join(CODECS)))
+
+
+def compress_block(data, codec, level=None):
+    """
+    Compresses data as one complete gzip member, bz2 or xz stream, or zstd
+    frame. Any number of these, one after another, decompress to the data
+    they held, one after another.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS.get(codec)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == "bz2":
+        return bz2.compress(data, level)
+    if codec == "xz":
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+    if codec == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError("Unknown codec: %s (available: %s)" % (
+        codec, ", ".join(CODECS)))
+
+
+class ParallelCompressWriter(object):
+    """
+    A file to write to that compresses what's written with codec, using a
+    pool of threads. Data is cut into block_size blocks, each compressed on
+    its own (see compress_block()) and written to fileobj in order, so the
+    result is an ordinary compressed file that any decompressor reads.
+    All of the codecs let go of the GIL while they work.
+
+    No more than about two blocks per thread are held at once. Blocks
+    compress a little less well than one long stream would.
+
+    Arguments:
+    fileobj -- where to write the compressed data; it's left open
+    codec -- one of CODECS
+    level -- compression level; defaults to DEFAULT_LEVELS[codec]
+    threads -- compression threads; defaults to the number of CPUs
+    """
+
+    def __init__(self, fileobj, codec, level=None, threads=None,
+            block_size=BLOCK_SIZE):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec: %s (available: %s)" % (
+                codec, ", ".join(CODECS)))
+        if codec == "zstd":
+            _require_zstandard()
+        self.fileobj = fileobj
+        self.codec = codec
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.closed = False
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        # Imported here, as only writing needs it and it's slow to import.
+        from concurrent import futures
+        self._pool = futures.ThreadPoolExecutor(max_workers=self.threads)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        # data may be a view of a buffer the caller is about to reuse, so
+        # it's always copied.
+        size = memoryview(data).nbytes
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._write_oldest()
+            self.fileobj.flush()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't bother compressing the rest of something that failed.
+            self.closed = True
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, block):
+        self._pending.append(self._pool.submit(
+            compress_block, block, self.codec, self.level))
+        while len(self._pending) > 2 * self.threads:
+            self._write_oldest()
+
+    def _write_oldest(self):
+        self.fileobj.write(self._pending.popleft().result())
+
+
+class _Unclosing(io.RawIOBase):
+    """
+    Raw reads from a stream without peek(), so it can be buffered; closing
+    it leaves the stream open.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if hasattr(self.stream, 'readinto'):
+            return self.stream.readinto(b)
+        data = self.stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError(
+            "Reading and writing zstd files requires the zstandard package")
@@ -0,0 +1,110 @@
+# Part of the pfile-tools package
+# Memory-mapped access to the raw data following a p-file header.
+# Requires numpy.
+#
+# Real p-files have a header larger than the structs in headers map, and
+# the data starts at its end, not at the end of the struct. Nothing in the
+# part of the header we map says where that is, so it has to come from the
+# caller: either data_offset, the byte offset of the data in the file, or
+# the number of receivers, in which case the data is taken to be the end of
+# the file. (Files made by pfile_tools.synthetic have their data right
+# after the struct; see synthetic.data_offset().)
+
+import ctypes
+import os
+
+import numpy as np
+
+from pfile_tools import compression
+
+
+def sample_dtype(point_size):
+    """
+    Returns the dtype of one complex sample: 'real' and 'imag' little-endian
+    integers, each point_size bytes long.
+    """
+    if point_size not in (2, 4):
+        raise ValueError("Unsupported point size: %s" % point_size)
+    component = '<i%d' % point_size
+    return np.dtype([('real', component), ('imag', component)])
+
+
+def data_shape(pfile, receivers=None, point_size=None, data_offset=None):
+    """
+    Works out the (receivers, slices, echoes, frames, frame_size) shape,
+    point size and offset of a p-file's data, and returns all three. Frames
+    include the baseline view.
+
+    One of receivers and data_offset must be given: receivers is worked out
+    from the data's size, or the data is taken to be the last receivers'
+    worth of the file. point_size defaults to the header's, or 2 if the
+    header doesn't say. Raises ValueError if the file size doesn't fit the
+    header.
+    """
+    if pfile.path is None:
+        raise ValueError("Can't find the data for a Pfile with no path")
+    if receivers is None and data_offset is None:
+        raise ValueError(
+            "Can't tell where the data starts in %s; give data_offset or "
+            "receivers" % pfile.path)
+    codec = compression.codec_of(pfile.path)
+    if codec is not None:
+        raise ValueError(
+            "Can't map the data of %s; it's compressed with %s" % (
+                pfile.path, codec))
+    if point_size is None:
+        point_size = getattr(pfile, 'point_size', 0) or 2
+    # The header's ints are signed; don't let garbage turn into huge shapes.
+    slices = max(pfile.slice_count, 1)
+    echoes = max(pfile.echo_count, 1)
+    frames = max(pfile.frame_count, 0) + 1
+    frame_size = pfile.frame_size
+    receiver_size = (
+        slices * echoes * frames * frame_size * sample_dtype(point_size).itemsize)
+    file_size = os.path.getsize(pfile.path)
+    if data_offset is None:
+        data_offset = file_size - receivers * receiver_size
+        if data_offset < ctypes.sizeof(type(pfile.header)):
+            raise ValueError(
+                "%s is too small for %d receivers of %d bytes" % (
+                    pfile.path, receivers, receiver_size))
+    elif receivers is None:
+        data_bytes = file_size - data_offset
+        if receiver_size == 0 or data_bytes % receiver_size:
+            raise ValueError(
+                "%s has %d bytes of data, which isn't a whole number of "
+                "receivers of %d bytes" % (pfile.path, data_bytes, receiver_size))
+        receivers = data_bytes // receiver_size
+    return (receivers, slices, echoes, frames, frame_size), point_size, data_offset
+
+
+def raw_data(pfile, receivers=None, point_size=None, data_offset=None):
+    """
+    Returns a read-only memmap over a p-file's raw data. See
+    Pfile.raw_data().
+    """
+    shape, point_size, data_offset = data_shape(
+        pfile, receivers, point_size, data_offset)
+    return np.memmap(
+        pfile.path, dtype=sample_dtype(point_size), mode='r',
+        offset=data_offset, shape=shape)
+
+
+def to_complex(samples):
+    """
+    Converts an array of raw samples to complex64.
+    """
+    out = np.empty(samples.shape, dtype=np.complex64)
+    out.real = samples['real']
+    out.imag = samples['imag']
+    return out
+
+
+def iter_slices(samples):
+    """
+    Yields (slice_number, complex64 array) for each slice of a raw_data()
+    array, reading one slice at a time.
+    """
+    for i in range(samples.shape[1]):
+        yield i, to_complex(samples[:, i])
+
@@ -0,0 +1,112 @@
+# Part of the pfile-tools package
+# NumPy structured dtypes for p-file headers, built from the ctypes
+# definitions in headers. Requires numpy.
+
+import ctypes
+
+import numpy as np
+
+from pfile_tools import headers
+
+# ctypes scalar types, and the numpy kind for each; the size comes from
+# ctypes.sizeof(), so platform-sized types (c_long, etc) come out right.
+_SCALAR_KINDS = {
+    ctypes.c_float: 'f',
+    ctypes.c_double: 'f',
+    ctypes.c_byte: 'i',
+    ctypes.c_short: 'i',
+    ctypes.c_int: 'i',
+    ctypes.c_long: 'i',
+    ctypes.c_longlong: 'i',
+    ctypes.c_ubyte: 'u',
+    ctypes.c_ushort: 'u',
+    ctypes.c_uint: 'u',
+    ctypes.c_ulong: 'u',
+    ctypes.c_ulonglong: 'u',
+    ctypes.c_bool: 'b',
+}
+
+_DTYPE_CACHE = {}
+
+
+def ctype_to_dtype(ctype):
+    """
+    Returns the little-endian numpy dtype matching a ctypes type.
+    Arrays of c_char become fixed-length byte strings.
+    """
+    if ctype is ctypes.c_char:
+        return np.dtype('S1')
+    if issubclass(ctype, ctypes.Array):
+        if ctype._type_ is ctypes.c_char:
+            return np.dtype('S%d' % ctype._length_)
+        return np.dtype((ctype_to_dtype(ctype._type_), (ctype._length_,)))
+    if issubclass(ctype, ctypes.Structure):
+        return header_dtype(ctype, include_padding=True)
+    kind = _SCALAR_KINDS.get(ctype)
+    if kind is None:
+        raise TypeError("Don't know a dtype for %s" % ctype.__name__)
+    return np.dtype('<%s%d' % (kind, ctypes.sizeof(ctype)))
+
+
+def header_dtype(header_cls, include_padding=False):
+    """
+    Returns a numpy dtype with the same layout as a ctypes header class:
+    same field names, explicit offsets, little-endian types, and the same
+    itemsize. Unknown 'pad' elements are left out unless include_padding
+    is true; the bytes are still accounted for in the offsets.
+    """
+    key = (header_cls, include_padding)
+    dt = _DTYPE_CACHE.get(key)
+    if dt is not None:
+        return dt
+    names, formats, offsets = [], [], []
+    for f in header_cls._fields_:
+        name, field_type = f[0], f[1]
+        if (name.find("pad") == 0) and not include_padding:
+            continue
+        names.append(name)
+        formats.append(ctype_to_dtype(field_type))
+        offsets.append(getattr(header_cls, name).offset)
+    dt = np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': ctypes.sizeof(header_cls)})
+    _DTYPE_CACHE[key] = dt
+    return dt
+
+
+def read_headers(paths, force_revision=None, include_padding=False):
+    """
+    Reads the headers of many p-files into one structured array, with one
+    record per file, in the order given.
+
+    All files must share a header revision. Unless force_revision is set,
+    it's detected from the first file, and a ValueError is raised if any
+    other file has a different one. With no paths, there's nothing to
+    detect it from, so force_revision is needed to get an empty array.
+    """
+    paths = list(paths)
+    revision = force_revision
+    if revision is None:
+        if not paths:
+            raise ValueError(
+                "No p-files to read; give force_revision for an empty array")
+        with open(paths[0], 'rb') as f:
+            revision = headers.sniff_revision(f.read(4))
+    header_cls = headers.header_class(revision)
+    out = np.zeros(len(paths), dtype=header_dtype(header_cls, include_padding))
+    # Read each file straight into its record's bytes.
+    raw = out.view(np.uint8).reshape(len(paths), out.dtype.itemsize)
+    for i, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            if f.readinto(raw[i]) < out.dtype.itemsize:
+                raise ValueError(
+                    "%s is too short for a revision %s header" % (
+                        path, revision))
+        if force_revision is None:
+            file_revision = headers.format_short_float(out['revision'][i])
+            if file_revision != revision:
+                raise ValueError("%s is revision %s, not %s" % (
+                    path, file_revision, revision))
+    return out
@@ -0,0 +1,155 @@
+# Part of the pfile-tools package
+# Exports headers from many p-files to columnar files -- one row per
+# p-file, one column per header field. Requires numpy; Parquet output
+# also requires pyarrow.
+
+from collections import namedtuple
+
+import numpy as np
+
+from pfile_tools import headers, scanner, dtypes
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ["npz", "parquet"]
+
+ExportStats = namedtuple("ExportStats", ["files", "failed"])
+
+
+def export_columns():
+    """
+    Returns a list of (name, numpy dtype) for every exported column: the
+    file's path and revision, then every non-padding field of every known
+    header revision, in the order they first appear.
+    """
+    columns = [("path", np.dtype(object)), ("revision", np.dtype(object))]
+    seen = set(name for name, dt in columns)
+    for revision in headers.known_revisions():
+        header_cls = headers.REVISIONS()[revision]
+        for f in header_cls._fields_:
+            name, field_type = f[0], f[1]
+            if name.find("pad") == 0 or name in seen:
+                continue
+            seen.add(name)
+            columns.append((name, dtypes.ctype_to_dtype(field_type)))
+    return columns
+
+
+def format_for_path(path):
+    if path.endswith(".parquet"):
+        return "parquet"
+    return "npz"
+
+
+def export_headers(paths, out_path, format=None, workers=None,
+        force_revision=None, batch_size=10000):
+    """
+    Reads the headers of many p-files in parallel and writes them to
+    out_path, one row per file. Files are handled batch_size at a time;
+    Parquet output is written a batch at a time, too.
+
+    Fields a file's revision doesn't have are null in Parquet output, and
+    zero or empty in NPZ output. Files that can't be read are logged and
+    left out.
+
+    Arguments:
+    paths -- an iterable of p-file paths; see scanner.find_pfiles()
+    format -- 'npz' or 'parquet'; guessed from out_path by default
+    workers, force_revision -- as for scanner.scan()
+
+    Returns an ExportStats.
+    """
+    format = format or format_for_path(out_path)
+    if format not in FORMATS:
+        raise ValueError("Unknown export format: %s" % format)
+    if format == "parquet" and pyarrow is None:
+        raise ImportError("Parquet export requires pyarrow")
+    columns = export_columns()
+    writer = _WRITERS[format](out_path, columns)
+    files = failed = 0
+    batch = []
+    results = scanner.scan(paths, workers=workers, force_revision=force_revision)
+    for result in results:
+        if result.error is not None:
+            logger.error("%s: %s" % (result.path, result.error))
+            failed += 1
+            continue
+        row = dict(result.values)
+        row["path"] = result.path
+        row["revision"] = result.revision
+        batch.append(row)
+        files += 1
+        if len(batch) >= batch_size:
+            writer.write(batch)
+            batch = []
+    if batch:
+        writer.write(batch)
+    writer.close()
+    return ExportStats(files, failed)
+
+
+class _NpzWriter(object):
+    """
+    Collects batches as numpy arrays, and saves them all on close(); NPZ
+    files can't be appended to.
+    """
+
+    def __init__(self, out_path, columns):
+        self.out_path = out_path
+        self.columns = columns
+        self.chunks = dict((name, []) for name, dt in columns)
+
+    def write(self, rows):
+        for name, dt in self.columns:
+            if name in ("path", "revision"):
+                dt = np.dtype(str)
+            values = [row.get(name, dt.type()) for row in rows]
+            self.chunks[name].append(np.array(values, dtype=dt))
+
+    def close(self):
+        arrays = {}
+        for name, dt in self.columns:
+            chunks = self.chunks[name]
+            arrays[name] = (np.concatenate(chunks) if chunks
+                else np.zeros(0, dtype=dt))
+        np.savez(self.out_path, **arrays)
+
+
+class _ParquetWriter(object):
+
+    def __init__(self, out_path, columns):
+        fields = []
+        for name, dt in columns:
+            if dt.kind in "OS":
+                arrow_type = pyarrow.string()
+            else:
+                arrow_type = pyarrow.from_numpy_dtype(dt)
+            fields.append(pyarrow.field(name, arrow_type))
+        self.schema = pyarrow.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(out_path, self.schema)
+
+    def write(self, rows):
+        data = {}
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if field.type == pyarrow.string():
+                values = [v.decode('latin-1') if isinstance(v, bytes) else v
+                    for v in values]
+            data[field.name] = values
+        self.writer.write_table(
+            pyarrow.Table.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+_WRITERS = {
+    "npz": _NpzWriter,
+    "parquet": _ParquetWriter,
+}
@@ -6,16 +6,69 @@
 
 from ctypes import *
 import datetime
+import functools
+import io
+import mmap
+import os
+import struct
+
+from pfile_tools import compression, instrumentation, struct_utils
+
+# Maps revision strings (see format_short_float) to header classes. The
+# built-in revisions are registered at the bottom of this module.
+_REVISION_REGISTRY = {}
+
+# Maps the raw first four bytes of a header to a registered revision
+# string. Anything else isn't cached, so junk files can't fill it up.
+_SNIFF_CACHE = {}
+
+# Smallest and largest registered header sizes, as (min, max).
+_HEADER_SIZES = [0, 0]
 
 
 def REVISIONS():
-    return {
-        '16'    : R16PfileHeader,
-        '20.006': R20_006PfileHeader,
-        '20.007': R20_007PfileHeader,
-        '24'    : R20_007PfileHeader,
-        '26.002': R26_002PfileHeader,
-    }
+    return dict(_REVISION_REGISTRY)
+
+
+def register_revision(revision, header_cls):
+    """
+    Registers a header class for a revision, so Pfile.from_file can read
+    it. revision is a string as returned by format_short_float -- '20.006',
+    not 20.006. Registering a known revision replaces its header class.
+    """
+    _REVISION_REGISTRY[revision] = header_cls
+    _SNIFF_CACHE.clear()
+    sizes = [sizeof(c) for c in _REVISION_REGISTRY.values()]
+    _HEADER_SIZES[:] = [min(sizes), max(sizes)]
+
+
+def header_class(revision):
+    """
+    Returns the header class for a revision string, raising UnknownRevision
+    if there isn't one.
+    """
+    header_cls = _REVISION_REGISTRY.get(revision)
+    if header_cls is None:
+        raise UnknownRevision("No header found for revision %s" % revision)
+    return header_cls
+
+
+@instrumentation.timed("pfile.sniff_revision")
+def sniff_revision(buf):
+    """
+    Returns the revision string from the start of a header that's already
+    been read (anything supporting the buffer protocol, at least four bytes
+    long). The revision needn't be a registered one.
+    """
+    raw = bytes(memoryview(buf)[:4])
+    revision = _SNIFF_CACHE.get(raw)
+    if revision is None:
+        if len(raw) < 4:
+            raise UnknownRevision("File is too short to have a revision")
+        revision = format_short_float(struct.unpack('<f', raw)[0])
+        if revision in _REVISION_REGISTRY:
+            _SNIFF_CACHE[raw] = revision
+    return revision
 
 
 def format_short_float(f):
@@ -29,19 +82,169 @@ def known_revisions():
     return [x for x in sorted(REVISIONS().keys())]
 
 
+def max_header_size():
+    """
+    Returns the size of the largest registered header: as much of a file
+    as it takes to hold the header, whatever its revision.
+    """
+    return _HEADER_SIZES[1]
+
+
+def read_fields(infile, fields, force_revision=None, max_gap=4096):
+    """
+    Reads just the named fields from a p-file's header, and returns a dict
+    of their values. Only the bytes holding those fields are read, with
+    ranges closer than max_gap bytes read together, so this touches far
+    less of the file than reading the whole header.
+
+    Compressed files have to be decompressed up to the fields anyway, so
+    if infile names one, its header is read with Pfile.from_file() instead.
+    Open compressed files can't be read this way, and raise ValueError, as
+    do files too short for their header.
+
+    Arguments:
+    infile -- a filename, or an open binary file with a fileno()
+    fields -- field names (dotted names for nested structs)
+    force_revision -- a header revision to use instead of detecting it
+    """
+    if hasattr(infile, 'fileno'):
+        fd = infile.fileno()
+        head = _pread(fd, compression.MAGIC_SIZE, 0)
+        codec = compression.detect(head)
+        if codec is not None:
+            raise ValueError(
+                "Can't read fields from an open file compressed with %s" %
+                codec)
+        return _read_fields(fd, head, fields, force_revision, max_gap)
+    with open(infile, 'rb', buffering=0) as filelike:
+        fd = filelike.fileno()
+        head = _pread(fd, compression.MAGIC_SIZE, 0)
+        if compression.detect(head) is None:
+            return _read_fields(fd, head, fields, force_revision, max_gap)
+    pfile = Pfile.from_file(infile, force_revision=force_revision)
+    return _field_values(pfile.header, fields)
+
+
+def _read_fields(fd, head, fields, force_revision, max_gap):
+    # head is the first few bytes of the file, already read.
+    revision = force_revision or sniff_revision(head)
+    header_cls = header_class(revision)
+    accessors = [
+        struct_utils.compile_accessor(header_cls, name) for name in fields]
+    buf = bytearray(sizeof(header_cls))
+    buf[:len(head)] = head
+    ranges = struct_utils.coalesce_ranges(
+        [(a.offset, a.offset + a.size) for a in accessors], max_gap)
+    for start, end in ranges:
+        data = _pread(fd, end - start, start)
+        if len(data) < end - start:
+            raise ValueError(
+                "File is too short for a revision %s header" % revision)
+        buf[start:end] = data
+    header = header_cls.from_buffer(buf)
+    return dict((a.name, a.get(header)) for a in accessors)
+
+
+def _field_values(header, fields):
+    return dict(
+        (name, struct_utils.compile_accessor(type(header), name).get(header))
+        for name in fields)
+
+
+def _pread(fd, count, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, count, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
 class Pfile(object):
     """
     The wrapper class for all manner of pfile header readin' structs.
     Really, only the one for now. Who knows, maybe ever?
     """
 
-    def __init__(self, header, revision):
+    def __init__(self, header, revision, memoize=False, path=None):
+        """
+        Header fields are available as attributes of the Pfile, but they're
+        only looked up in the header when you ask for them. If memoize is
+        true, each field is stored on the Pfile the first time it's read;
+        later changes to the header won't show up here.
+
+        path is the file the header came from, if any; it's needed to get
+        at the raw data.
+        """
         self.header = header
         self.revision = revision
-        for f in self.header._fields_:
-            # Copy all the fields into this class.
-            name = f[0]
-            setattr(self, name, getattr(self.header, name))
+        self.memoize = memoize
+        self.path = path
+        self._mmap = None
+
+    def __getattr__(self, name):
+        # Only called for names not found the normal way -- that is, for
+        # header fields, which we fetch from the struct on demand.
+        header = self.__dict__.get('header')
+        if header is None or name not in _field_names(type(header)):
+            raise AttributeError(
+                "%r object has no attribute %r" % (type(self).__name__, name))
+        value = getattr(header, name)
+        if self.memoize:
+            self.__dict__[name] = value
+        return value
+
+    def __dir__(self):
+        names = set(dir(type(self))) | set(self.__dict__)
+        if self.header is not None:
+            names.update(_field_names(type(self.header)))
+        return sorted(names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the memory mapping behind an mmap-backed header. The header
+        struct is dropped first, as the mapping can't be closed while it's
+        still exported; don't hold on to self.header past this point.
+        Does nothing for headers that were read into memory.
+        """
+        if self._mmap is None:
+            return
+        self.header = None
+        self._mmap.close()
+        self._mmap = None
+
+    def raw_data(self, receivers=None, point_size=None, data_offset=None):
+        """
+        Returns the raw acquisition data as a read-only numpy memmap, shaped
+        (receivers, slices, echoes, frames, frame_size). Frame 0 of each echo
+        is the baseline view. Nothing is read until you index into it.
+        Samples have 'real' and 'imag' integer fields; see
+        pfile_tools.data.to_complex(). Requires numpy.
+
+        The header doesn't say where the data starts, so give either
+        data_offset, its offset in the file, or receivers, and the data is
+        taken to run to the end of the file. point_size defaults to the
+        header's. See pfile_tools.data.
+        """
+        from pfile_tools import data
+        return data.raw_data(
+            self, receivers=receivers, point_size=point_size,
+            data_offset=data_offset)
+
+    def iter_slices(self, receivers=None, point_size=None, data_offset=None):
+        """
+        Yields (slice_number, samples) for each slice, where samples is a
+        complex64 array shaped (receivers, echoes, frames, frame_size).
+        Only one slice is held in memory at a time. Requires numpy.
+        """
+        from pfile_tools import data
+        return data.iter_slices(self.raw_data(
+            receivers=receivers, point_size=point_size,
+            data_offset=data_offset))
 
     @property
     def exam_datetime(self):
@@ -52,38 +255,182 @@ class Pfile(object):
         return datetime.datetime.utcfromtimestamp(self.series_timestamp)
 
     @classmethod
-    def from_file(cls, infile, force_revision=None):
-        filelike = infile
-        if not hasattr('seek', filelike):
-            filelike = open(filelike, 'rb')
-        revision = force_revision or format_short_float(cls._major_revision(filelike))
-        filelike.seek(0)
-        rev_hash = REVISIONS()
-        header_cls = rev_hash.get(revision)
-        if header_cls is None:
-            raise UnknownRevision("No header found for revision %s" % revision)
+    @instrumentation.timed("pfile.from_file")
+    def from_file(cls, infile, force_revision=None, use_mmap=False,
+            memoize=False):
+        """
+        Reads a pfile header from a filename or an open binary file. Open
+        files are read from their current position, and are left just past
+        the header; they needn't be seekable.
+
+        Compressed files (gzip, bz2, xz or zstd; see pfile_tools.compression)
+        are decompressed as they're read, and only as far as the end of the
+        header. Open files are read as they are; pass them through
+        compression.open_pfile() first if they might be compressed.
+
+        If use_mmap is true, the header is laid directly over a private,
+        copy-on-write mapping of the file instead of being read into a fresh
+        struct: only the pages holding fields you touch are ever read, and
+        changes to the header never reach the file. Use the result as a
+        context manager (or call close()) to release the mapping. Only plain
+        files on disk can be mapped, and open ones only if they're at the
+        start; anything else (compressed files, archive members, pipes) is
+        read as usual.
+
+        memoize is passed on to the Pfile; see __init__.
+        """
+        if hasattr(infile, 'read'):
+            if use_mmap and _mappable(infile):
+                return cls._from_mmap(infile, force_revision, memoize)
+            return cls._from_filelike(infile, force_revision, memoize)
+        filelike, codec = _open(infile)
+        with filelike:
+            if use_mmap and codec is None:
+                return cls._from_mmap(filelike, force_revision, memoize)
+            return cls._from_filelike(filelike, force_revision, memoize)
+
+    @classmethod
+    async def afrom_file(cls, infile, force_revision=None, use_mmap=False,
+            memoize=False, executor=None):
+        """
+        Like from_file, but for asyncio: the blocking reads happen in
+        executor (by default, the event loop's default executor).
+        """
+        # Imported here, as it's slow to import and the scripts never
+        # need it.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(
+            cls.from_file, infile, force_revision=force_revision,
+            use_mmap=use_mmap, memoize=memoize))
+
+    @classmethod
+    def _from_filelike(cls, filelike, force_revision, memoize=False):
+        revision = force_revision
+        if not revision and hasattr(filelike, 'peek'):
+            # Buffered files, decompressors and open_stream() results can
+            # show us the revision without reading it.
+            start = filelike.peek(4)[:4]
+            if len(start) == 4:
+                revision = sniff_revision(start)
+        if not revision:
+            return cls._from_prefix(filelike, memoize)
+        header_cls = header_class(revision)
         header = header_cls()
-        filelike.readinto(header)
-        return cls(header, revision)
+        got = _readinto(filelike, memoryview(header).cast('B'))
+        _check_length(got, header_cls, revision)
+        return cls(header, revision, memoize, _filelike_path(filelike))
 
     @classmethod
-    def _major_revision(cls, filelike):
-        rnh = RevisionNum()
-        filelike.seek(0)
-        filelike.readinto(rnh)
-        return rnh.revision
+    def _from_prefix(cls, filelike, memoize=False):
+        # For streams we can't peek at: read as much as any header needs,
+        # then find out which one it is. This needs no seeking, and usually
+        # no second read.
+        prefix = bytearray(_HEADER_SIZES[0])
+        got = _readinto(filelike, memoryview(prefix))
+        revision = sniff_revision(prefix)
+        header_cls = header_class(revision)
+        header = header_cls()
+        view = memoryview(header).cast('B')
+        view[:got] = memoryview(prefix)[:got]
+        if got == len(prefix):
+            got += _readinto(filelike, view[got:])
+        _check_length(got, header_cls, revision)
+        return cls(header, revision, memoize, _filelike_path(filelike))
 
+    @classmethod
+    def _from_mmap(cls, filelike, force_revision, memoize=False):
+        fileno = filelike.fileno()
+        if force_revision:
+            length = sizeof(header_class(force_revision))
+        else:
+            length = min(os.fstat(fileno).st_size, max_header_size())
+        # The mapping holds its own duplicate of the descriptor, so the file
+        # itself can be closed as soon as we return.
+        with instrumentation.timed("pfile.mmap"):
+            mapped = mmap.mmap(fileno, length, access=mmap.ACCESS_COPY)
+        try:
+            revision = force_revision or sniff_revision(mapped)
+            header_cls = header_class(revision)
+            _check_length(length, header_cls, revision)
+            header = header_cls.from_buffer(mapped)
+        except:
+            mapped.close()
+            raise
+        pfile = cls(header, revision, memoize, _filelike_path(filelike))
+        pfile._mmap = mapped
+        return pfile
 
-class UnknownRevision(RuntimeError):
-    pass
 
+def _check_length(length, header_cls, revision):
+    if length < sizeof(header_cls):
+        raise ValueError(
+            "File is too short for a revision %s header" % revision)
 
-class RevisionNum(LittleEndianStructure):
 
-    _pack_ = 1
+def _mappable(filelike):
+    """
+    Whether filelike is a plain file on disk, at its start -- so mapping its
+    descriptor from offset 0 maps what reading it would read.
+    """
+    raw = getattr(filelike, 'raw', filelike)
+    if not isinstance(raw, io.FileIO):
+        return False
+    try:
+        return filelike.tell() == 0 and os.path.isfile(raw.name)
+    except (OSError, TypeError, ValueError):
+        return False
 
-    _fields_ = [
-        ('revision', c_float)]
+
+@instrumentation.timed("pfile.open")
+def _open(path):
+    return compression.open_read(path)
+
+
+@instrumentation.timed("pfile.read")
+def _readinto(filelike, view):
+    """
+    Fills view from filelike, reading until it's full or the file ends;
+    pipes and decompressors can return less than asked for. Returns the
+    number of bytes read.
+    """
+    got = 0
+    while got < len(view):
+        if hasattr(filelike, 'readinto'):
+            n = filelike.readinto(view[got:])
+        else:
+            data = filelike.read(len(view) - got)
+            n = len(data)
+            view[got:got+n] = data
+        if not n:
+            break
+        got += n
+    return got
+
+
+def _filelike_path(filelike):
+    name = getattr(filelike, 'name', None)
+    if isinstance(name, (str, bytes)):
+        return name
+    return None
+
+
+_FIELD_NAMES = {}
+
+
+def _field_names(header_cls):
+    """
+    Returns the set of field names in a header class, computed once.
+    """
+    names = _FIELD_NAMES.get(header_cls)
+    if names is None:
+        names = frozenset(f[0] for f in header_cls._fields_)
+        _FIELD_NAMES[header_cls] = names
+    return names
+
+
+class UnknownRevision(RuntimeError):
+    pass
 
 
 class R16PfileHeader(LittleEndianStructure):
@@ -104,7 +451,8 @@ class R16PfileHeader(LittleEndianStructure):
         ('frame_count', c_short),
         ('pad_4', c_char * 4),
         ('frame_size', c_ushort),
-        ('pad_5', c_char * 20),
+        ('point_size', c_short),
+        ('pad_5', c_char * 18),
         ('acq_x_res', c_ushort),
         ('acq_y_Res', c_short),
         ('recon_x_res', c_short),
@@ -314,7 +662,8 @@ class R20_006PfileHeader(LittleEndianStructure):
         ('frame_count', c_short),
         ('pad_4', c_char * 4),
         ('frame_size', c_ushort),
-        ('pad_5', c_char * 20),
+        ('point_size', c_short),
+        ('pad_5', c_char * 18),
         ('acq_x_res', c_ushort),
         ('acq_y_Res', c_short),
         ('recon_x_res', c_short),
@@ -532,7 +881,8 @@ class R20_007PfileHeader(LittleEndianStructure):
         ('frame_count', c_short),
         ('pad_4', c_char * 4),
         ('frame_size', c_ushort),
-        ('pad_5', c_char * 20),
+        ('point_size', c_short),
+        ('pad_5', c_char * 18),
         ('acq_x_res', c_ushort),
         ('acq_y_Res', c_short),
         ('recon_x_res', c_short),
@@ -753,7 +1103,8 @@ class R26_002PfileHeader(LittleEndianStructure):
         ('frame_count', c_short),
         ('pad_4', c_char * 4),
         ('frame_size', c_ushort),
-        ('pad_5', c_char * 20),
+        ('point_size', c_short),
+        ('pad_5', c_char * 18),
         ('acq_x_res', c_ushort),
         ('acq_y_Res', c_short),
         ('recon_x_res', c_short),
@@ -955,3 +1306,10 @@ class R26_002PfileHeader(LittleEndianStructure):
         ('pad_37', c_char * 115),
         ('long_coil_name', c_char * 24),
         ('pad_38', c_char * 543)]
+
+
+register_revision('16', R16PfileHeader)
+register_revision('20.006', R20_006PfileHeader)
+register_revision('20.007', R20_007PfileHeader)
+register_revision('24', R20_007PfileHeader)
+register_revision('26.002', R26_002PfileHeader)
@@ -0,0 +1,216 @@
+# Part of the pfile-tools package
+# Lightweight timers for the reading and anonymizing code, to see where
+# batch jobs spend their time.
+#
+# Off by default. Turn it on with enable(), or by setting the
+# PFILE_TOOLS_PROFILE environment variable to a filename (or '-' for
+# stderr): the totals are then written there as JSON when Python exits.
+# Work done in scanner.pool_map()'s worker processes is timed there and
+# merged into the parent's totals.
+
+import atexit
+import functools
+import inspect
+import json
+import math
+import os
+import sys
+import time
+
+ENV_VAR = "PFILE_TOOLS_PROFILE"
+
+enabled = False
+
+_stages = {}
+
+
+class Stage(object):
+    """
+    Totals for one named stage: call count, total/min/max time, and a
+    histogram of call times in power-of-two microsecond buckets.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = seconds * 1e6
+        bucket = int(math.ceil(math.log(micros, 2))) if micros > 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        """Adds the totals from another Stage to this one."""
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        for bucket, n in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "mean_seconds": self.total / self.count if self.count else 0.0,
+            "min_seconds": self.min or 0.0,
+            "max_seconds": self.max,
+            # keyed by each bucket's upper bound
+            "histogram_us": dict(
+                ("<=%d" % (2 ** b), n) for b, n in sorted(self.buckets.items())),
+        }
+
+
+def enable(dump_to=None):
+    """
+    Turns timing on. If dump_to (a filename, or '-' for stderr) is given,
+    the report is written there as JSON when Python exits.
+    """
+    global enabled
+    enabled = True
+    if dump_to:
+        atexit.register(dump_json, dump_to)
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    _stages.clear()
+
+
+def record(stage, seconds):
+    s = _stages.get(stage)
+    if s is None:
+        s = _stages[stage] = Stage()
+    s.add(seconds)
+
+
+def stages():
+    """
+    Returns the Stages recorded so far, keyed by name; they pickle, so
+    another process can merge() them into its own.
+    """
+    return dict(_stages)
+
+
+def merge(other_stages):
+    """
+    Adds Stages from stages() -- usually another process's -- to this
+    process's totals.
+    """
+    for name, other in other_stages.items():
+        s = _stages.get(name)
+        if s is None:
+            s = _stages[name] = Stage()
+        s.merge(other)
+
+
+class timed(object):
+    """
+    Times a block (as a context manager) or every call of a function (as a
+    decorator) under the given stage name. For generator functions, the time
+    spent producing every item is counted, but not the time the caller
+    spends between items. Costs next to nothing when timing is off.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is not None:
+            record(self.stage, time.perf_counter() - self.start)
+            self.start = None
+
+    def __call__(self, func):
+        stage = self.stage
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                if not enabled:
+                    return func(*args, **kwargs)
+                return _timed_iter(stage, func(*args, **kwargs))
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+
+
+def _timed_iter(stage, gen):
+    spent = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - start
+            yield item
+    finally:
+        gen.close()
+        record(stage, spent)
+
+
+def report():
+    """
+    Returns the totals for every stage so far, as a dict of dicts.
+    """
+    return dict((name, s.as_dict()) for name, s in _stages.items())
+
+
+def dump_json(out):
+    """
+    Writes report() as JSON to out: a filename, '-' for stderr, or an
+    open file.
+    """
+    if out == "-":
+        out = sys.stderr
+    if hasattr(out, "write"):
+        json.dump(report(), out, indent=2, sort_keys=True)
+        out.write("\n")
+        return
+    with open(out, "w") as f:
+        json.dump(report(), f, indent=2, sort_keys=True)
+
+
+if os.environ.get(ENV_VAR):
+    import multiprocessing
+    # Worker processes report to their parent instead; see
+    # scanner.pool_map().
+    if multiprocessing.parent_process() is None:
+        enable(dump_to=os.environ[ENV_VAR])
@@ -0,0 +1,194 @@
+# Part of the pfile-tools package
+# Utilities for copying p-files and patching bits of them.
+
+import contextlib
+import errno
+import os
+import shutil
+import logging
+
+from pfile_tools import instrumentation
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# From linux/fs.h: clone a whole file, sharing its blocks (btrfs, XFS...)
+FICLONE = 0x40049409
+
+# errnos meaning "this way of copying doesn't work here; try another"
+_UNSUPPORTED = frozenset([
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.EBADF, errno.ENOTTY, errno.EPERM])
+
+COPY_CHUNK = 1 << 30
+
+_SIZE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(s):
+    """
+    Parses a byte count like 4096, 512K or 2G.
+    """
+    s = s.strip().upper().rstrip("B")
+    multiplier = _SIZE_SUFFIXES.get(s[-1:], 1)
+    if multiplier != 1:
+        s = s[:-1]
+    return int(float(s) * multiplier)
+
+
+@instrumentation.timed("io.copy_file")
+def copy_file(src, dst):
+    """
+    Copies src to dst, leaving as much of the work as possible to the
+    kernel: first we try to reflink (share blocks with) the file, then
+    copy_file_range() (which NFS 4.2 and some others do server-side), then
+    sendfile(), and finally a plain read/write copy.
+
+    Returns the name of the method that finished the copy. Raises
+    shutil.SameFileError, as shutil.copyfile() does, if src and dst are the
+    same file -- opening dst would truncate src.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(
+            "%r and %r are the same file" % (src, dst))
+    with open(src, 'rb') as fin:
+        with open(dst, 'wb') as fout:
+            size = os.fstat(fin.fileno()).st_size
+            if _reflink(fin, fout):
+                return "reflink"
+            copied = 0
+            for name, copier in _COPIERS:
+                copied = copier(fin, fout, copied, size)
+                if copied >= size:
+                    return name
+            # Shouldn't get here; _copy_plain always finishes.
+            return "copy"
+
+
+def _reflink(fin, fout):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        return True
+    except (IOError, OSError) as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+        return False
+
+
+def _copy_file_range(fin, fout, copied, size):
+    if not hasattr(os, 'copy_file_range'):
+        return copied
+    return _copy_kernel(
+        fin, fout, copied, size,
+        lambda in_fd, out_fd, offset, count:
+            os.copy_file_range(in_fd, out_fd, count, offset, offset))
+
+
+def _copy_sendfile(fin, fout, copied, size):
+    if not hasattr(os, 'sendfile'):
+        return copied
+    def sendfile(in_fd, out_fd, offset, count):
+        os.lseek(out_fd, offset, os.SEEK_SET)
+        return os.sendfile(out_fd, in_fd, offset, count)
+    return _copy_kernel(fin, fout, copied, size, sendfile)
+
+
+def _copy_kernel(fin, fout, copied, size, copy_func):
+    """
+    Calls copy_func(in_fd, out_fd, offset, count) until the file is copied
+    or copy_func gives up. Returns how far we got.
+    """
+    in_fd, out_fd = fin.fileno(), fout.fileno()
+    while copied < size:
+        try:
+            sent = copy_func(
+                in_fd, out_fd, copied, min(COPY_CHUNK, size - copied))
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            logger.debug("Kernel copy unsupported: %s" % e)
+            break
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _copy_plain(fin, fout, copied, size):
+    fin.seek(copied)
+    fout.seek(copied)
+    shutil.copyfileobj(fin, fout, 1 << 20)
+    return size
+
+
+_COPIERS = [
+    ("copy_file_range", _copy_file_range),
+    ("sendfile", _copy_sendfile),
+    ("copy", _copy_plain),
+]
+
+
+def copy_stream(src, dst, bufsize=1 << 20):
+    """
+    Copies the rest of the stream src to dst through one bufsize buffer,
+    which is reused for every read, so memory use stays the same however
+    much is copied. Neither needs to be seekable. Returns the number of
+    bytes copied.
+    """
+    if not hasattr(src, 'readinto'):
+        copied = 0
+        while True:
+            data = src.read(bufsize)
+            if not data:
+                return copied
+            dst.write(data)
+            copied += len(data)
+    view = memoryview(bytearray(bufsize))
+    copied = 0
+    while True:
+        n = src.readinto(view)
+        if not n:
+            return copied
+        dst.write(view[:n])
+        copied += n
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """
+    Opens a temporary file next to path for writing, and yields it. If the
+    block finishes, the file is synced and renamed to path; if it raises,
+    the file is removed. Either way, path never holds a partial file.
+    """
+    tmp = os.path.join(
+        os.path.dirname(path), ".%s.partial" % os.path.basename(path))
+    try:
+        with open(tmp, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+@instrumentation.timed("io.write_ranges")
+def write_ranges(f, buf, ranges):
+    """
+    Writes the given (start, end) ranges of buf to the same offsets in the
+    open file f. Returns the number of bytes written.
+    """
+    view = memoryview(buf).cast('B')
+    written = 0
+    for start, end in ranges:
+        f.seek(start)
+        f.write(view[start:end])
+        written += end - start
+    return written
@@ -0,0 +1,161 @@
+# Part of the pfile-tools package
+# Reads headers from lots of p-files at once, using a pool of processes.
+
+import os
+import fnmatch
+from collections import namedtuple
+from concurrent import futures
+
+from pfile_tools import compression, headers, instrumentation, struct_utils
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATTERN = "P*.7"
+
+# Names matching a pattern plus one of these are taken to be compressed
+# p-files, as long as they really are compressed.
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zst")
+
+# values is a list of (label, value) pairs; error is None unless reading
+# the file failed, in which case it's a description of what went wrong.
+ScanResult = namedtuple("ScanResult", ["path", "revision", "values", "error"])
+
+
+def find_pfiles(paths, pattern=DEFAULT_PATTERN, compressed=True):
+    """
+    Yields p-file paths. Files in paths are yielded as-is; directories
+    are walked recursively for files whose names match pattern -- or, if
+    compressed is true, that are compressed and whose names match pattern
+    followed by one of COMPRESSED_SUFFIXES (so P12345.7.gz is found too).
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                full_path = os.path.join(dirpath, name)
+                if fnmatch.fnmatch(name, pattern):
+                    yield full_path
+                elif (compressed and matches_compressed(name, pattern)
+                        and _is_compressed(full_path)):
+                    yield full_path
+
+
+def matches_compressed(name, pattern):
+    """
+    Whether name is pattern plus one of COMPRESSED_SUFFIXES.
+    """
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix) and fnmatch.fnmatch(
+                name[:-len(suffix)], pattern):
+            return True
+    return False
+
+
+def _is_compressed(path):
+    try:
+        return compression.codec_of(path) is not None
+    except EnvironmentError:
+        return False
+
+
+def scan_header(path, force_revision=None, fields=None, include_padding=False):
+    """
+    Reads the header of one p-file and returns a ScanResult. Errors are
+    caught and returned in the result, so one bad file doesn't stop a scan.
+
+    Arguments:
+    path -- the p-file to read
+    force_revision -- a header revision to use instead of detecting it
+    fields -- if given, a list of labels (or glob patterns); only matching
+        fields are returned
+    include_padding -- whether to return unknown 'pad' elements
+    """
+    try:
+        with headers.Pfile.from_file(
+                path, force_revision=force_revision, use_mmap=True) as pfile:
+            values = header_values(pfile, fields, include_padding)
+            return ScanResult(path, pfile.revision, values, None)
+    except Exception as e:
+        return ScanResult(path, None, [], "%s: %s" % (type(e).__name__, e))
+
+
+@instrumentation.timed("scanner.header_values")
+def header_values(pfile, fields=None, include_padding=False):
+    """
+    Returns a list of (label, value) pairs from a Pfile's header, as in
+    ScanResult.values.
+    """
+    return [(info.label, info.value) for info in struct_utils.iter_struct(
+        pfile.header, skip_padding=not include_padding, include=fields)]
+
+
+def scan(paths, workers=None, force_revision=None, fields=None,
+        include_padding=False, backlog=4):
+    """
+    Reads headers from many p-files in a process pool, yielding ScanResults
+    in the order they finish.
+
+    Each worker reads its own files, so slow storage is read from several
+    places at once. Only about workers * backlog files are queued at a
+    time, so paths can be a long (or endless) iterator.
+
+    Arguments:
+    paths -- an iterable of p-file paths; see find_pfiles()
+    workers -- number of processes; defaults to the number of CPUs
+    backlog -- files queued per worker
+    Other arguments are as for scan_header().
+    """
+    if fields is not None:
+        fields = tuple(fields)
+    args = ((path, force_revision, fields, include_padding) for path in paths)
+    return pool_map(scan_header, args, workers, backlog)
+
+
+def pool_map(func, args_iter, workers=None, backlog=4):
+    """
+    Calls func(*args) for each tuple in args_iter in a process pool,
+    yielding results in the order they finish. Only about workers * backlog
+    calls are queued at once, so args_iter can be a long iterator.
+
+    If instrumentation is on, the workers' timings are merged into this
+    process's.
+    """
+    workers = workers or os.cpu_count() or 1
+    args_iter = iter(args_iter)
+    profile = instrumentation.enabled
+    with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for args in args_iter:
+            pending.add(pool.submit(_pool_call, func, args, profile))
+            if len(pending) < workers * backlog:
+                continue
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for f in done:
+                yield _pool_result(f)
+        for f in futures.as_completed(pending):
+            yield _pool_result(f)
+
+
+def _pool_call(func, args, profile):
+    """
+    Runs func(*args) in a worker, returning its result and, if profile is
+    true, the timings of just this call.
+    """
+    if not profile:
+        return func(*args), None
+    # Forked workers start with a copy of the parent's totals; don't send
+    # those back again.
+    instrumentation.reset()
+    instrumentation.enable()
+    return func(*args), instrumentation.stages()
+
+
+def _pool_result(f):
+    result, stages = f.result()
+    if stages:
+        instrumentation.merge(stages)
+    return result
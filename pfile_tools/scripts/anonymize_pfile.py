@@ -5,29 +5,72 @@
 #
 # A script to strip the identifying information from a GE p-file.
 
+import contextlib
+import os
 import optparse
 import sys
-import shutil
 import logging
 logger = logging.getLogger(__name__)
 
 import pfile_tools
-from pfile_tools import headers, anonymizer
+from pfile_tools import (
+    headers, anonymizer, archives, compression, instrumentation, io_utils,
+    scanner)
+from pfile_tools.io_utils import parse_size
 
 
 def build_option_parser(anonymization_list):
     revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
     p = optparse.OptionParser(
-        usage="usage: %prog [OPTIONS] pfile pfile_out",
-        description="Removes personally-identifying information from a GE P-file",
+        usage="usage: %prog [OPTIONS] pfile pfile_out\n"
+            "       %prog [OPTIONS] --tar archive.tar archive_out.tar",
+        description="Removes personally-identifying information from a GE "
+            "P-file. Compressed p-files (gzip, bz2, xz, zstd) are written "
+            "compressed the same way, or as --compress says. Use - for pfile "
+            "(or pfile_out) to read from standard input (or write to "
+            "standard output); the file is then streamed through in one "
+            "pass, and compressed only with --compress.",
         version="%prog "+pfile_tools.VERSION)
     p.add_option(
         "-r", "--revision", action="store", choices=headers.known_revisions(),
         help="Force a header revision (available: %s)" % revision_opt_strs)
     p.add_option("--inplace", action="store_true",
         help="Edit file in-place. Ignores pfile_out.")
+    p.add_option("--copy-mode", action="store", choices=["offload", "full"],
+        default="offload",
+        help="How to make pfile_out: 'offload' lets the kernel copy the "
+            "file (reflink where possible); 'full' copies the file and "
+            "rewrites the whole header (default: offload)")
+    p.add_option("--tar", action="store_true",
+        help="Anonymize every p-file in a tar archive, writing a new "
+            "archive in one pass")
+    p.add_option(
+        "--pattern", action="store", default=scanner.DEFAULT_PATTERN,
+        help="With --tar, filename pattern for p-files (default: %s)" %
+            scanner.DEFAULT_PATTERN)
+    p.add_option(
+        "--buffer-size", action="store", default=None,
+        help="With standard input or output, bytes copied at a time, eg 4M "
+            "(default: %dM)" % (anonymizer.STREAM_BUFSIZE >> 20))
+    p.add_option(
+        "--compress", action="store", choices=compression.CODECS,
+        default=None,
+        help="Compress pfile_out as it's written, with gzip, bz2, xz or zstd")
+    p.add_option(
+        "--compression-level", action="store", type="int", default=None,
+        help="Compression level (default: the codec's usual one)")
+    p.add_option(
+        "--threads", action="store", type="int", default=None,
+        help="Number of compression threads (default: number of CPUs)")
     p.add_option("-v", "--verbose", action="store_true",
         help="Print lots of extra debugging.")
+    p.add_option("--profile", action="store", default=None, metavar="FILE",
+        help="Write timings of each stage to FILE as JSON ('-' for stderr)")
+    add_anonymization_options(p, anonymization_list)
+    return p
+
+
+def add_anonymization_options(p, anonymization_list):
     group = optparse.OptionGroup(p, "Anonymization options")
     for entry in anonymization_list:
         group.add_option(
@@ -35,7 +78,6 @@ def build_option_parser(anonymization_list):
             choices=["yes", "no"], default="yes", metavar="yes/no",
             help="Set %s to %r (yes)" % (entry.description, entry.value))
     p.add_option_group(group)
-    return p
 
 
 def filter_anonymization_list(l, options):
@@ -67,27 +109,6 @@ def setup_files(options, args):
     return (pfile_in, pfile_out)
 
 
-def read_pfile(pfile_in, options):
-    rev = options.revision
-    logger.debug("Reading %s, revision %s" % (pfile_in, rev))
-    return headers.Pfile.from_file(pfile_in, force_revision=rev)
-
-
-def write_header(f, ph):
-    """
-    Write a pfle header to a file (file or filename)
-    """
-    if hasattr(f, 'seek'):
-        return _write_header_inner(f, ph)
-    else:
-        with open(f, "r+b") as infile:
-            return _write_header_inner(infile, ph)
-
-
-def _write_header_inner(f, ph):
-    f.write(ph)
-
-
 def main():
     parser = build_option_parser(anonymizer.DEFAULT_LIST)
     (options, args) = parser.parse_args()
@@ -96,17 +117,99 @@ def main():
     if len(args) < 1:
         parser.error("pfile_in is required")
     setup_logger(options)
+    if options.profile:
+        instrumentation.enable(dump_to=options.profile)
     pfile_in, pfile_out = setup_files(options, args)
-    pfile = read_pfile(pfile_in, options)
+    piped = "-" in (pfile_in, pfile_out)
+    if options.inplace and (options.tar or piped):
+        parser.error("Archives and pipes can't be anonymized in place")
+    if options.inplace and compression.codec_of(pfile_in):
+        parser.error("Compressed p-files can't be anonymized in place")
+    if options.inplace and options.compress:
+        parser.error("--compress can't be used with --inplace")
+    if options.compress and not compression.available(options.compress):
+        parser.error("--compress=zstd needs the zstandard package")
+    if (not options.inplace and not piped and os.path.exists(pfile_out)
+            and os.path.samefile(pfile_in, pfile_out)):
+        parser.error("pfile and pfile_out are the same file; use --inplace")
+    bufsize = anonymizer.STREAM_BUFSIZE
+    if options.buffer_size is not None:
+        try:
+            bufsize = parse_size(options.buffer_size)
+        except ValueError:
+            bufsize = 0
+        if bufsize <= 0:
+            parser.error("Bad buffer size: %s" % options.buffer_size)
 
     anon_list = filter_anonymization_list(anonymizer.DEFAULT_LIST, options)
     a = anonymizer.Anonymizer(anon_list)
-    a.anonymize(pfile.header)
-
-    if not options.inplace:
-        logger.debug("Copying %s to %s" % (pfile_in, pfile_out))
-        shutil.copyfile(pfile_in, pfile_out)
-    write_header(pfile_out, pfile.header)
+    if options.tar:
+        anonymize_tar(pfile_in, pfile_out, a, options, bufsize)
+        return
+    if piped:
+        anonymize_pipe(pfile_in, pfile_out, a, options, bufsize)
+        return
+    if options.inplace:
+        pfile_out = None
+    anonymizer.anonymize_file(
+        pfile_in, pfile_out, a, force_revision=options.revision,
+        copy_mode=options.copy_mode, compress=options.compress,
+        level=options.compression_level, threads=options.threads)
+
+
+@contextlib.contextmanager
+def open_output(path, options):
+    """
+    Opens path ("-" for standard output) for writing, compressed as
+    --compress says. Files are written under a temporary name and renamed
+    when they're complete.
+    """
+    if path == "-":
+        with _compressing(sys.stdout.buffer, options) as f:
+            yield f
+        sys.stdout.buffer.flush()
+        return
+    with io_utils.replacing(path) as out:
+        with _compressing(out, options) as f:
+            yield f
+
+
+@contextlib.contextmanager
+def _compressing(f, options):
+    if not options.compress:
+        yield f
+        return
+    with compression.ParallelCompressWriter(
+            f, options.compress, options.compression_level,
+            options.threads) as writer:
+        yield writer
+
+
+def anonymize_pipe(pfile_in, pfile_out, a, options, bufsize):
+    """
+    Anonymizes pfile_in to pfile_out as streams, for when either is "-".
+    """
+    if pfile_in == "-":
+        instream = compression.open_stream(sys.stdin.buffer)[0]
+    else:
+        instream = compression.open_pfile(pfile_in)
+    with instream, open_output(pfile_out, options) as outstream:
+        anonymizer.anonymize_stream(
+            instream, outstream, a, options.revision, bufsize)
+
+
+def anonymize_tar(tar_in, tar_out, a, options, bufsize):
+    src = sys.stdin.buffer if tar_in == "-" else tar_in
+    try:
+        with open_output(tar_out, options) as dst:
+            names = archives.anonymize_tar(
+                src, dst, a, pattern=options.pattern,
+                force_revision=options.revision, bufsize=bufsize)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+    for name in names:
+        logger.debug("Anonymized %s" % name)
 
 
 if __name__ == "__main__":
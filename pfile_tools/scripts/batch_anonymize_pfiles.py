@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# A script to strip the identifying information from a whole directory
+# of GE p-files.
+
+import os
+import optparse
+import sys
+import logging
+logger = logging.getLogger(__name__)
+
+import pfile_tools
+from pfile_tools import headers, anonymizer, scanner, batch_anonymizer
+from pfile_tools.scripts.anonymize_pfile import (
+    add_anonymization_options, filter_anonymization_list, setup_logger)
+
+JOURNAL_NAME = ".anonymize_journal"
+
+
+def build_option_parser(anonymization_list):
+    revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS] src_dir dst_dir\n"
+            "       %prog [OPTIONS] --inplace path [path ...]",
+        description="Removes personally-identifying information from every "
+            "GE P-file in src_dir, writing them to the same places in "
+            "dst_dir. Interrupted runs can be resumed by running again. "
+            "With --inplace, p-files (and p-files in directories) are "
+            "patched where they are.",
+        version="%prog "+pfile_tools.VERSION)
+    p.add_option(
+        "-r", "--revision", action="store", choices=headers.known_revisions(),
+        help="Force a header revision (available: %s)" % revision_opt_strs)
+    p.add_option(
+        "-j", "--jobs", action="store", type="int", default=None,
+        help="Number of worker processes (default: number of CPUs)")
+    p.add_option(
+        "--pattern", action="store", default=scanner.DEFAULT_PATTERN,
+        help="Filename pattern for p-files (default: %s)" %
+            scanner.DEFAULT_PATTERN)
+    p.add_option("--inplace", action="store_true",
+        help="Anonymize files in-place, writing only the changed bytes, and "
+            "report throughput.")
+    p.add_option(
+        "--journal", action="store", default=None,
+        help="Journal of finished files, for resuming (default: "
+            "dst_dir/%s)" % JOURNAL_NAME)
+    p.add_option("--copy-mode", action="store", choices=["offload", "full"],
+        default="offload",
+        help="How to copy p-files: 'offload' lets the kernel copy the "
+            "file (reflink where possible); 'full' copies the file and "
+            "rewrites the whole header (default: offload)")
+    p.add_option("-v", "--verbose", action="store_true",
+        help="Print lots of extra debugging.")
+    add_anonymization_options(p, anonymization_list)
+    return p
+
+
+def main():
+    parser = build_option_parser(anonymizer.DEFAULT_LIST)
+    (options, args) = parser.parse_args()
+    if options.inplace and len(args) < 1:
+        parser.error("At least one path is required")
+    if not options.inplace and len(args) < 2:
+        parser.error("Both src_dir and dst_dir are required")
+    setup_logger(options)
+    anon_list = filter_anonymization_list(anonymizer.DEFAULT_LIST, options)
+    a = anonymizer.Anonymizer(anon_list)
+    if options.inplace:
+        anonymize_inplace(args, a, options)
+    else:
+        anonymize_tree(args[0], args[1], a, options)
+
+
+def anonymize_inplace(paths, a, options):
+    stats = anonymizer.anonymize_inplace(
+        scanner.find_pfiles(paths, options.pattern, compressed=False), a,
+        force_revision=options.revision)
+    sys.stderr.write(
+        "%d anonymized, %d failed; %d bytes written in %.2fs "
+        "(%.1f files/s, %.1f bytes/s)\n" % (
+            stats.files, stats.failed, stats.bytes_written, stats.seconds,
+            stats.files_per_second, stats.bytes_per_second))
+    if stats.failed:
+        sys.exit(1)
+
+
+def anonymize_tree(src_dir, dst_dir, a, options):
+    if not os.path.isdir(dst_dir):
+        os.makedirs(dst_dir)
+    journal = options.journal or os.path.join(dst_dir, JOURNAL_NAME)
+    done = skipped = failures = 0
+    for result in batch_anonymizer.anonymize_tree(
+            src_dir, dst_dir, a, workers=options.jobs, journal_path=journal,
+            pattern=options.pattern, force_revision=options.revision,
+            copy_mode=options.copy_mode):
+        if result.error is not None:
+            logger.error("%s: %s" % (result.src, result.error))
+            failures += 1
+        elif result.skipped:
+            logger.debug("Already done: %s" % result.src)
+            skipped += 1
+        else:
+            logger.debug("Anonymized %s to %s" % (result.src, result.dst))
+            done += 1
+    sys.stderr.write("%d anonymized, %d already done, %d failed\n" % (
+        done, skipped, failures))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
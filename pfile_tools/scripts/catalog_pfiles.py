@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# A script to keep a SQLite catalog of p-file headers, and search it.
+
+import sys
+import optparse
+import csv
+import logging
+logger = logging.getLogger(__name__)
+
+import pfile_tools
+from pfile_tools import headers, scanner, catalog
+
+
+def build_option_parser():
+    revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS] database [path ...]",
+        description="Catalogs GE P-file headers in a SQLite database. Any "
+            "paths (p-files or directories) are cataloged; only new or "
+            "changed files are read. Use --where to search the catalog.",
+        version="%prog "+pfile_tools.VERSION)
+    p.add_option(
+        "-r", "--revision", action="store", choices=headers.known_revisions(),
+        help="Force a header revision (available: %s)" % revision_opt_strs)
+    p.add_option(
+        "-j", "--jobs", action="store", type="int", default=None,
+        help="Number of worker processes (default: number of CPUs)")
+    p.add_option(
+        "--pattern", action="store", default=scanner.DEFAULT_PATTERN,
+        help="Filename pattern for p-files in directories (default: %s)" %
+            scanner.DEFAULT_PATTERN)
+    p.add_option(
+        "--prune", action="store_true", default=False,
+        help="Remove cataloged files under paths that no longer exist")
+    p.add_option(
+        "--where", action="store", default=None,
+        help="Print cataloged files matching this SQL expression, "
+            "eg \"psd_name = 'epi' AND tr > 2000\"")
+    p.add_option(
+        "--columns", action="store", default="path",
+        help="Comma-separated columns to print with --where (default: path)")
+    p.add_option(
+        "--separator", action="store", default="\t",
+        help="Output field separator (default: \\t)")
+    p.add_option("-v", "--verbose", action="store_true",
+        help="Print lots of extra debugging.")
+    return p
+
+
+def main():
+    parser = build_option_parser()
+    opts, args = parser.parse_args()
+    if len(args) < 1:
+        parser.error("Must specify a database.")
+    if len(args) < 2 and opts.where is None:
+        parser.error("Must specify paths to catalog, or --where.")
+    logging.basicConfig(
+        level=logging.DEBUG if opts.verbose else logging.ERROR)
+    with catalog.Catalog(args[0]) as cat:
+        if len(args) > 1:
+            stats = cat.update(
+                args[1:], pattern=opts.pattern, workers=opts.jobs,
+                force_revision=opts.revision, prune=opts.prune)
+            sys.stderr.write(
+                "%d added, %d updated, %d unchanged, %d removed, "
+                "%d failed\n" % stats)
+        if opts.where is not None:
+            columns = [c.strip() for c in opts.columns.split(",")]
+            writer = csv.writer(sys.stdout, delimiter=opts.separator)
+            writer.writerow(columns)
+            for row in cat.query(opts.where, columns=columns):
+                writer.writerow([row[c] for c in columns])
+
+
+if __name__ == "__main__":
+    main()
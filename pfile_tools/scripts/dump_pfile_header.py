@@ -10,14 +10,15 @@ import optparse
 import csv
 
 import pfile_tools
-from pfile_tools import headers, struct_utils
+from pfile_tools import headers, instrumentation, struct_utils
 
 
 def build_option_parser():
     revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
     p = optparse.OptionParser(
         usage="usage: %prog [OPTIONS] pfile",
-        description="Dumps header information from a GE P-file",
+        description="Dumps header information from a GE P-file, which may "
+            "be compressed (gzip, bz2, xz, zstd)",
         version="%prog "+pfile_tools.VERSION)
     p.add_option(
         "-r", "--revision", action="store", choices=headers.known_revisions(),
@@ -31,9 +32,18 @@ def build_option_parser():
     p.add_option(
         "--show-padding", action="store_true", default=False, dest="padding",
         help="Print unknown 'padding' elements")
+    p.add_option(
+        "--include", action="append", default=None, metavar="PATTERN",
+        help="Only print fields matching this glob pattern (repeatable)")
+    p.add_option(
+        "--exclude", action="append", default=[], metavar="PATTERN",
+        help="Don't print fields matching this glob pattern (repeatable)")
     p.add_option(
         "--separator", action="store", default="\t",
         help="Output field separator (default: \\t)")
+    p.add_option(
+        "--profile", action="store", default=None, metavar="FILE",
+        help="Write timings of each stage to FILE as JSON ('-' for stderr)")
     return p
 
 
@@ -60,14 +70,16 @@ def main():
     opts, args = parser.parse_args()
     if len(args) < 1:
         parser.error("Must specify a p-file.")
+    if opts.profile:
+        instrumentation.enable(dump_to=opts.profile)
     rev = opts.revision
     ph = headers.Pfile.from_file(args[0], force_revision=rev)
-    dumped = struct_utils.dump_struct(ph.header)
+    dumped = struct_utils.iter_struct(
+        ph.header, skip_padding=not opts.padding,
+        include=opts.include, exclude=opts.exclude)
     writer = csv.writer(sys.stdout, delimiter=opts.separator)
     writer.writerow(header_columns(opts))
     for info in dumped:
-        if (info.label.find("pad") == 0) and not opts.padding:
-            continue
         writer.writerow(to_list(info, opts))
 
 
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# A script to export headers from lots of p-files to a columnar file.
+
+import sys
+import optparse
+import logging
+logger = logging.getLogger(__name__)
+
+import pfile_tools
+from pfile_tools import headers, scanner, export
+
+
+def build_option_parser():
+    revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS] output path [path ...]",
+        description="Exports header information from many GE P-files to a "
+            "columnar file, with one row per p-file and one column per "
+            "header field.",
+        version="%prog "+pfile_tools.VERSION)
+    p.add_option(
+        "-r", "--revision", action="store", choices=headers.known_revisions(),
+        help="Force a header revision (available: %s)" % revision_opt_strs)
+    p.add_option(
+        "-f", "--format", action="store", choices=export.FORMATS,
+        help="Output format: npz or parquet (default: from the output "
+            "filename; npz unless it ends in .parquet)")
+    p.add_option(
+        "-j", "--jobs", action="store", type="int", default=None,
+        help="Number of worker processes (default: number of CPUs)")
+    p.add_option(
+        "--pattern", action="store", default=scanner.DEFAULT_PATTERN,
+        help="Filename pattern for p-files in directories (default: %s)" %
+            scanner.DEFAULT_PATTERN)
+    p.add_option(
+        "--batch-size", action="store", type="int", default=10000,
+        help="Files per batch written (default: 10000)")
+    return p
+
+
+def main():
+    parser = build_option_parser()
+    opts, args = parser.parse_args()
+    if len(args) < 2:
+        parser.error("Must specify an output file and at least one path.")
+    logging.basicConfig(level=logging.ERROR)
+    paths = scanner.find_pfiles(args[1:], opts.pattern)
+    stats = export.export_headers(
+        paths, args[0], format=opts.format, workers=opts.jobs,
+        force_revision=opts.revision, batch_size=opts.batch_size)
+    sys.stderr.write("%d exported, %d failed\n" % stats)
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# A script to make synthetic p-files for testing.
+
+import optparse
+import sys
+
+import pfile_tools
+from pfile_tools import headers, synthetic
+from pfile_tools.io_utils import parse_size
+
+
+def build_option_parser():
+    revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS] directory",
+        description="Makes synthetic GE P-files with random, plausible "
+            "headers and sparse, empty data.",
+        version="%prog "+pfile_tools.VERSION)
+    p.add_option(
+        "-n", "--count", action="store", type="int", default=10,
+        help="Number of files to make (default: 10)")
+    p.add_option(
+        "-r", "--revision", action="append", default=None,
+        choices=headers.known_revisions(),
+        help="Revision to make; repeat for several (default: all, in "
+            "turn; available: %s)" % revision_opt_strs)
+    p.add_option(
+        "--data-size", action="store", default=None,
+        help="Bytes of data per file, eg 2G (default: whatever the header "
+            "describes)")
+    p.add_option(
+        "--seed", action="store", type="int", default=None,
+        help="Random seed, for making the same files again")
+    return p
+
+
+def main():
+    parser = build_option_parser()
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Must specify a directory.")
+    data_size = None
+    if opts.data_size is not None:
+        try:
+            data_size = parse_size(opts.data_size)
+        except ValueError:
+            parser.error("Bad data size: %s" % opts.data_size)
+    paths = synthetic.make_corpus(
+        args[0], opts.count, opts.revision, data_size, opts.seed)
+    for path in paths:
+        sys.stdout.write(path + "\n")
+
+
+if __name__ == "__main__":
+    main()
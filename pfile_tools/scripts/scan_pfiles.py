@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# Part of the pfile-tools package
+#
+# A script to dump header data from lots of p-files at once.
+
+import sys
+import optparse
+import csv
+import logging
+logger = logging.getLogger(__name__)
+
+import pfile_tools
+from pfile_tools import archives, headers, scanner
+
+
+def build_option_parser():
+    revision_opt_strs = ", ".join([str(r) for r in headers.known_revisions()])
+    p = optparse.OptionParser(
+        usage="usage: %prog [OPTIONS] path [path ...]",
+        description="Dumps header information from many GE P-files. Paths "
+            "may be p-files or directories, which are searched recursively. "
+            "With --archive, paths are tar or zip archives ('-' for a tar "
+            "archive on standard input), which are read in one pass without "
+            "extracting anything.",
+        version="%prog "+pfile_tools.VERSION)
+    p.add_option(
+        "-r", "--revision", action="store", choices=headers.known_revisions(),
+        help="Force a header revision (available: %s)" % revision_opt_strs)
+    p.add_option(
+        "-j", "--jobs", action="store", type="int", default=None,
+        help="Number of worker processes (default: number of CPUs)")
+    p.add_option(
+        "--pattern", action="store", default=scanner.DEFAULT_PATTERN,
+        help="Filename pattern for p-files in directories (default: %s)" %
+            scanner.DEFAULT_PATTERN)
+    p.add_option(
+        "--archive", action="store_true", default=False,
+        help="Read the p-files inside tar or zip archives")
+    p.add_option(
+        "--fields", action="store", default=None,
+        help="Comma-separated list of fields (or glob patterns) to print "
+            "(default: all)")
+    p.add_option(
+        "--show-padding", action="store_true", default=False, dest="padding",
+        help="Print unknown 'padding' elements")
+    p.add_option(
+        "--separator", action="store", default="\t",
+        help="Output field separator (default: \\t)")
+    return p
+
+
+def main():
+    parser = build_option_parser()
+    opts, args = parser.parse_args()
+    if len(args) < 1:
+        parser.error("Must specify at least one p-file or directory.")
+    logging.basicConfig(level=logging.ERROR)
+    fields = None
+    if opts.fields:
+        fields = [f.strip() for f in opts.fields.split(",")]
+    if opts.archive:
+        results = scan_archives(args, opts, fields)
+    else:
+        paths = scanner.find_pfiles(args, opts.pattern)
+        results = scanner.scan(
+            paths, workers=opts.jobs, force_revision=opts.revision,
+            fields=fields, include_padding=opts.padding)
+    writer = csv.writer(sys.stdout, delimiter=opts.separator)
+    writer.writerow(["path", "field", "value"])
+    failures = 0
+    for result in results:
+        if result.error is not None:
+            logger.error("%s: %s" % (result.path, result.error))
+            failures += 1
+            continue
+        for label, value in result.values:
+            writer.writerow([result.path, label, str(value)])
+    if failures:
+        sys.exit(1)
+
+
+def scan_archives(archive_paths, opts, fields):
+    for archive in archive_paths:
+        if archive == "-":
+            archive = sys.stdin.buffer
+        for result in archives.scan_archive(
+                archive, opts.pattern, force_revision=opts.revision,
+                fields=fields, include_padding=opts.padding):
+            yield result
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,68 @@
 # Some utilities for working with ctypes Structures
 
 import ctypes
+import fnmatch
 from collections import namedtuple
 
+from pfile_tools import instrumentation
+
 StructInfo = namedtuple("StructInfo",
     ["label", "depth", "value", "field_type", "size", "offset"])
 
+# One entry in a struct class's flattened layout. accessor is None for
+# rows describing whole structures.
+FieldLayout = namedtuple("FieldLayout",
+    ["label", "depth", "offset", "size", "field_type", "is_padding",
+     "is_bytes", "accessor"])
+
+_LAYOUTS = {}
+
+
+def struct_layout(struct_class, include_structs=False):
+    """
+    Returns a flat tuple of FieldLayouts for every non-structure field in
+    struct_class, descending into nested structures, in dump_struct()
+    order. It's computed once per class and cached, since a layout never
+    changes. If include_structs is true, rows for the structures themselves
+    are included.
+    """
+    key = (struct_class, include_structs)
+    layout = _LAYOUTS.get(key)
+    if layout is None:
+        rows = []
+        _struct_layout_rec(struct_class, struct_class, rows, include_structs)
+        layout = tuple(rows)
+        _LAYOUTS[key] = layout
+    return layout
+
+
+def _struct_layout_rec(root_class, struct_class, rows, include_structs,
+    prefix='', depth=0, base_offset=0):
+    if include_structs:
+        rows.append(FieldLayout(
+            "%s (%s)" % (prefix, struct_class.__name__), depth, base_offset,
+            ctypes.sizeof(struct_class), str(struct_class), False, False,
+            None))
+    for f in struct_class._fields_:
+        name = f[0]
+        field_type = f[1]
+        field_meta = getattr(struct_class, name)
+        field_offset = base_offset + field_meta.offset
+        if issubclass(field_type, ctypes.Structure):
+            _struct_layout_rec(root_class, field_type, rows, include_structs,
+                "%s%s." % (prefix, name), depth+1, field_offset)
+            continue
+        label = prefix+name
+        is_bytes = (field_type is ctypes.c_char or (
+            issubclass(field_type, ctypes.Array) and
+            field_type._type_ is ctypes.c_char))
+        rows.append(FieldLayout(
+            label, depth, field_offset, field_meta.size, field_type.__name__,
+            name.find("pad") == 0, is_bytes,
+            compile_accessor(root_class, label)))
+
 
+@instrumentation.timed("struct.dump_struct")
 def dump_struct(struct, include_structs=False):
     """
     Recursively travels through a ctypes.Structure and returns a list of
@@ -17,70 +73,198 @@ def dump_struct(struct, include_structs=False):
     If include_structs is true, output will include lines for individual
     structures and their sizes and offsets -- not just non-structure fields.
     """
-    output = []
-    _dump_struct_rec(struct, output, include_structs)
-    return output
+    return list(iter_struct(struct, include_structs))
 
 
-def _dump_struct_rec(
-    struct, output, include_structs=False, prefix='', depth=0, base_offset=0):
+@instrumentation.timed("struct.iter_struct")
+def iter_struct(struct, include_structs=False, skip_padding=False,
+        include=None, exclude=None):
     """
-    Internal recursive method for dumping structures.
-    Appends to the "output" parameter.
+    Like dump_struct(), but yields StructInfos one at a time, and can leave
+    fields out. Fields that are left out are never decoded.
+
+    Arguments:
+    skip_padding -- leave out unknown 'pad' elements
+    include -- if given, a list of glob patterns; only fields whose labels
+        match one of them are yielded
+    exclude -- a list of glob patterns for labels to leave out
     """
-    struct_class = type(struct)
-    if include_structs:
-        output.append(StructInfo(
-            "%s (%s)" % (prefix, struct_class.__name__),
-            depth, '', str(struct_class), ctypes.sizeof(struct_class), base_offset))
-    for f in struct._fields_:
-        name = f[0]
-        field_type = f[1]
-        field_meta = getattr(struct_class, name)
-        field = getattr(struct, name)
-        if isinstance(field, bytes):
-            # replace null bytes with '@' to make them visible
-            a = getattr(type(struct), name)
-            dummy = ctypes.c_char*a.size
-            field = dummy.from_buffer(struct, a.offset).raw
-            field = field.split(b'\x00')
-            field = b''.join(field)
-            field = field.replace(b'\0', b'@')
-        cur_prefix = "%s%s." % (prefix, name)
-        field_offset = base_offset + field_meta.offset
-        if isinstance(field, ctypes.Structure):
-            _dump_struct_rec(field, output, include_structs, cur_prefix,
-                depth+1, field_offset)
+    rows = filtered_layout(
+        type(struct), include_structs, skip_padding, include, exclude)
+    for row in rows:
+        if row.accessor is None:
+            value = ''
+        elif row.is_bytes:
+            # strip null bytes, so padding and short strings print cleanly
+            dummy = ctypes.c_char*row.size
+            value = dummy.from_buffer(struct, row.offset).raw.replace(b'\0', b'')
         else:
-            label = prefix+name
-            output.append(StructInfo(
-                label, depth, field, field_type.__name__, field_meta.size, field_offset))
+            value = row.accessor.get(struct)
+        yield StructInfo(
+            row.label, row.depth, value, row.field_type, row.size, row.offset)
+
+
+_FILTERED_LAYOUTS = {}
+
+
+def filtered_layout(struct_class, include_structs=False, skip_padding=False,
+        include=None, exclude=None):
+    """
+    Returns struct_layout(struct_class, include_structs), less the rows
+    iter_struct() would leave out. Cached, like struct_layout().
+    """
+    include = tuple(include) if include is not None else None
+    exclude = tuple(exclude or ())
+    key = (struct_class, include_structs, skip_padding, include, exclude)
+    rows = _FILTERED_LAYOUTS.get(key)
+    if rows is None:
+        rows = tuple(
+            row for row in struct_layout(struct_class, include_structs)
+            if not (skip_padding and row.is_padding)
+            and (include is None or _matches_any(row.label, include))
+            and not _matches_any(row.label, exclude))
+        _FILTERED_LAYOUTS[key] = rows
+    return rows
+
+
+def _matches_any(label, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(label, pattern):
+            return True
+    return False
+
+
+def coalesce_ranges(ranges, gap=0):
+    """
+    Sorts a list of (start, end) byte ranges, merging overlapping ranges and
+    those less than gap bytes apart.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class DirtyRanges(object):
+    """
+    Records which byte ranges of a struct have been changed, so they can be
+    written back without writing the whole struct. Pass one to
+    set_struct_value().
+    """
+
+    def __init__(self):
+        self.ranges = []
+
+    def add(self, start, end):
+        self.ranges.append((start, end))
+
+    def coalesced(self, gap=0):
+        """
+        Returns the recorded ranges as a sorted list of (start, end), with
+        overlapping ranges -- and those less than gap bytes apart -- merged.
+        """
+        return coalesce_ranges(self.ranges, gap)
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __iter__(self):
+        return iter(self.coalesced())
+
+
+class FieldAccessor(object):
+    """
+    Reads and writes one field of a struct class, found by dotted name,
+    directly at its absolute offset in a struct's buffer. Get these from
+    compile_accessor(), which only works out the offset once per class.
+    """
+
+    __slots__ = ("name", "offset", "size", "ctype")
+
+    def __init__(self, name, offset, size, ctype):
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.ctype = ctype
+
+    def get(self, struct):
+        field = self.ctype.from_buffer(struct, self.offset)
+        if isinstance(field, (ctypes.Structure, ctypes.Array)) and not (
+                hasattr(field, "value")):
+            return field
+        return field.value
+
+    def set(self, struct, value, dirty=None):
+        # clear the field completely before setting it
+        ctypes.memset(ctypes.addressof(struct) + self.offset, 0, self.size)
+        if isinstance(value, str):
+            # char fields only take bytes
+            value = value.encode('ascii')
+        self.ctype.from_buffer(struct, self.offset).value = value
+        if dirty is not None:
+            dirty.add(self.offset, self.offset + self.size)
+
+    def __repr__(self):
+        return "FieldAccessor(%r, offset=%d, size=%d, ctype=%s)" % (
+            self.name, self.offset, self.size, self.ctype.__name__)
+
+
+_ACCESSORS = {}
+
+
+def compile_accessor(struct_class, field_name):
+    """
+    Returns a FieldAccessor for a dotted field name in struct_class,
+    building it the first time. Raises AttributeError if there's no such
+    field.
+    """
+    key = (struct_class, field_name)
+    accessor = _ACCESSORS.get(key)
+    if accessor is not None:
+        return accessor
+    cls = struct_class
+    offset = 0
+    for part in field_name.split("."):
+        field_types = dict((f[0], f[1]) for f in getattr(cls, "_fields_", []))
+        if part not in field_types:
+            raise AttributeError(
+                "%s has no field %r" % (struct_class.__name__, field_name))
+        field = getattr(cls, part)
+        offset += field.offset
+        field_type = field_types[part]
+        # Byte-swapping structures store their scalars as swapped types
+        if issubclass(cls, ctypes.LittleEndianStructure):
+            field_type = getattr(field_type, "__ctype_le__", field_type)
+        elif issubclass(cls, ctypes.BigEndianStructure):
+            field_type = getattr(field_type, "__ctype_be__", field_type)
+        cls = field_type
+    accessor = FieldAccessor(field_name, offset, field.size, field_type)
+    _ACCESSORS[key] = accessor
+    return accessor
+
+
+def get_struct_value(struct, field_name):
+    """
+    Gets a value from a ctypes struct, by dotted struct name
+    """
+    return compile_accessor(type(struct), field_name).get(struct)
 
 
-def set_struct_value(struct, field_name, value):
+def set_struct_value(struct, field_name, value, dirty=None):
     """
-    Sets a value in a ctypes struct, by dotted struct name
+    Sets a value in a ctypes struct, by dotted struct name. If dirty (a
+    DirtyRanges) is given, the bytes of the field are recorded in it.
     """
-    parts = field_name.split(".")
-    sh = struct
-    while len(parts) > 1:
-        subhead_key = parts[0]
-        parts = parts[1:]
-        sh = getattr(sh, subhead_key)
-    # clear the field completely before setting it
-    field = getattr(type(sh), parts[0])
-    dummy = ctypes.c_char*field.size
-    dummy.from_buffer(sh, field.offset).raw = b'\0'*field.size
-    setattr(sh, parts[0], value)
+    compile_accessor(type(struct), field_name).set(struct, value, dirty)
 
 
 def has_struct_value(struct, field_name):
-    parts = field_name.split(".")
-    sh = struct
-    while len(parts) > 1:
-        subhead_key = parts[0]
-        parts = parts[1:]
-        if not hasattr(sh, subhead_key):
-            return False
-        sh = getattr(sh, subhead_key)
-    return hasattr(sh, field_name)
+    try:
+        compile_accessor(type(struct), field_name)
+    except AttributeError:
+        return False
+    return True
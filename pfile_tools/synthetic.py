@@ -0,0 +1,166 @@
+# Part of the pfile-tools package
+# Makes synthetic p-files -- plausible-looking headers with made-up
+# values, and sparse data -- for testing and benchmarking without any
+# patient data.
+
+import ctypes
+import os
+import random
+import time
+
+from pfile_tools import headers, struct_utils
+
+_SURNAMES = ["SMITH", "JONES", "GARCIA", "NGUYEN", "MUELLER", "ROSSI",
+    "KOWALSKI", "TANAKA", "OKAFOR", "LARSEN"]
+_GIVEN_NAMES = ["ALEX", "SAM", "JORDAN", "TAYLOR", "CASEY", "ROBIN", "KIM",
+    "JAMIE", "LEE", "MORGAN"]
+_PSDS = ["epi", "epi2", "fgre", "fse", "spiral", "probe-p", "3dfsgre"]
+_COILS = ["8HRBRAIN", "32Ch Head", "HNS Head", "Body"]
+
+# Receivers used to size the data when it isn't given.
+DEFAULT_RECEIVERS = 8
+
+
+def random_values(rng, revision):
+    """
+    Returns a dict of plausible, random values for a header's fields,
+    keyed by field name.
+    """
+    exam_time = rng.randint(
+        int(time.mktime((2005, 1, 1, 0, 0, 0, 0, 0, -1))),
+        int(time.mktime((2020, 1, 1, 0, 0, 0, 0, 0, -1))))
+    series_time = exam_time + rng.randint(0, 3600)
+    scan = time.gmtime(series_time)
+    birth_year = scan.tm_year - rng.randint(18, 90)
+    name = "%s^%s" % (rng.choice(_SURNAMES), rng.choice(_GIVEN_NAMES))
+    frame_size = rng.choice([64, 96, 128, 256])
+    return {
+        "revision": float(revision),
+        "scan_date_str": time.strftime("%m/%d/%y", scan),
+        "scan_time_str": time.strftime("%H:%M", scan),
+        "pass_count": 1,
+        "slice_count": rng.randint(1, 48),
+        "echo_count": rng.choice([1, 1, 1, 2, 4]),
+        "frame_count": rng.randint(16, 128),
+        "frame_size": frame_size,
+        "point_size": 2,
+        "acq_x_res": frame_size,
+        "acq_y_Res": frame_size,
+        "recon_x_res": frame_size,
+        "recon_y_res": frame_size,
+        "image_size": frame_size,
+        "exam_number": rng.randint(1, 65535),
+        "series_number": rng.randint(1, 30),
+        "exam_timestamp": exam_time,
+        "series_timestamp": series_time,
+        "magnet_strength": rng.choice([15000, 30000]),
+        "patient_name": name,
+        "patient_name_2": name,
+        "patient_id": "%010d" % rng.randint(0, 10 ** 10 - 1),
+        "patient_id_2": "%010d" % rng.randint(0, 10 ** 10 - 1),
+        "date_of_birth": "%04d%02d%02d" % (
+            birth_year, rng.randint(1, 12), rng.randint(1, 28)),
+        "patient_age": scan.tm_year - birth_year,
+        "patient_sex": rng.choice([1, 2]),
+        "patient_weight_g": rng.randint(45000, 120000),
+        "hospital_name": "SYNTHETIC HOSPITAL",
+        "exam_description": "SYNTHETIC EXAM",
+        "series_description": "SYNTHETIC SERIES",
+        "protocol": "SYNTH",
+        "psd_name": rng.choice(_PSDS),
+        "coil_name": rng.choice(_COILS),
+        "tr": rng.choice([400, 1000, 2000, 2500, 3000]) * 1000,
+        "te": rng.randint(2, 100) * 1000,
+        "ti": rng.choice([0, 0, 450, 900]) * 1000,
+        "x_field_of_view": rng.choice([220.0, 240.0, 256.0]),
+        "y_field_of_view": rng.choice([220.0, 240.0, 256.0]),
+        "z_thickness": rng.choice([1.0, 2.0, 3.0, 3.5, 5.0]),
+        "scan_duration": rng.uniform(10.0, 900.0),
+    }
+
+
+def random_header(revision, rng=None, **overrides):
+    """
+    Returns a header struct for revision full of random, plausible values.
+    Fields in overrides are set as given. Fields the revision doesn't have
+    are skipped.
+    """
+    rng = rng or random.Random()
+    header = headers.header_class(revision)()
+    values = random_values(rng, revision)
+    values.update(overrides)
+    for name, value in values.items():
+        if struct_utils.has_struct_value(header, name):
+            struct_utils.set_struct_value(header, name, value)
+    return header
+
+
+def default_data_size(header, receivers=DEFAULT_RECEIVERS):
+    """
+    Returns the size of the data the header describes, for receivers
+    receivers, laid out as pfile_tools.data expects.
+    """
+    return (receivers * max(header.slice_count, 1) * max(header.echo_count, 1)
+        * (header.frame_count + 1) * header.frame_size * 2 * header.point_size)
+
+
+def data_offset(header):
+    """
+    Returns where make_pfile() puts the data by default: right after the
+    header struct. Pass it to Pfile.raw_data() for synthetic files.
+    """
+    return ctypes.sizeof(header)
+
+
+def make_pfile(path, revision=None, data_size=None, rng=None,
+        data_offset=None, **overrides):
+    """
+    Writes a synthetic p-file to path, and returns its header. The data is
+    all zeros, and sparse where the filesystem allows, so even very large
+    files are quick to make and take no space.
+
+    Arguments:
+    revision -- the header revision; random by default
+    data_size -- bytes of data after the header; by default, the size the
+        header's dimensions describe, with DEFAULT_RECEIVERS receivers
+    rng -- a random.Random, for repeatable files
+    data_offset -- where the data starts; by default, right after the
+        header struct. Real p-files have more header than the struct, so
+        their data starts later; give a larger offset to imitate that (the
+        gap is zeros).
+    overrides -- header values to use instead of random ones
+    """
+    rng = rng or random.Random()
+    revision = revision or rng.choice(headers.known_revisions())
+    header = random_header(revision, rng, **overrides)
+    if data_size is None:
+        data_size = default_data_size(header)
+    if struct_utils.has_struct_value(header, "data_size"):
+        header.data_size = data_size
+    offset = data_offset
+    if offset is None:
+        offset = ctypes.sizeof(header)
+    if offset < ctypes.sizeof(header):
+        raise ValueError("data_offset is inside the header")
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(offset + data_size)
+    return header
+
+
+def make_corpus(directory, count, revisions=None, data_size=None, seed=None):
+    """
+    Makes count synthetic p-files in directory, named P00001.7, P00002.7 and
+    so on, cycling through revisions (all known ones by default). Returns
+    their paths. The same seed always makes the same files.
+    """
+    rng = random.Random(seed)
+    revisions = revisions or headers.known_revisions()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, "P%05d.7" % (i + 1))
+        make_pfile(path, revisions[i % len(revisions)], data_size, rng)
+        paths.append(path)
+    return paths
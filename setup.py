@@ -11,11 +11,22 @@ setup(
     author_email='njvack@wisc.edu',
     license='BSD License',
     url='https://github.com/njvack/pfile-tools',
-    packages=['pfile_tools'],
+    packages=['pfile_tools', 'pfile_tools.scripts'],
+    python_requires='>=3.9',
+    extras_require={
+        'numpy': ['numpy'],
+        'parquet': ['numpy', 'pyarrow'],
+        'zstd': ['zstandard'],
+    },
     entry_points={
         'console_scripts': [
             'dump_pfile_header = pfile_tools.scripts.dump_pfile_header:main',
-            'anonymize_pfile = pfile_tools.scripts.anonymize_pfile:main'
+            'anonymize_pfile = pfile_tools.scripts.anonymize_pfile:main',
+            'scan_pfiles = pfile_tools.scripts.scan_pfiles:main',
+            'catalog_pfiles = pfile_tools.scripts.catalog_pfiles:main',
+            'export_pfile_headers = pfile_tools.scripts.export_pfile_headers:main',
+            'batch_anonymize_pfiles = pfile_tools.scripts.batch_anonymize_pfiles:main',
+            'make_synthetic_pfiles = pfile_tools.scripts.make_synthetic_pfiles:main'
         ]}
     )
 
@@ -0,0 +1,37 @@
+import ctypes
+import random
+
+import pytest
+
+from pfile_tools import anonymizer, headers, synthetic
+
+
+@pytest.fixture(params=["16", "20.006", "26.002"])
+def revision(request):
+    return request.param
+
+
+@pytest.fixture
+def pfile_path(tmp_path, revision):
+    """A small synthetic p-file, with some non-zero data after the header."""
+    path = str(tmp_path / "P00001.7")
+    header = synthetic.make_pfile(
+        path, revision, data_size=64 << 10, rng=random.Random(1))
+    with open(path, "r+b") as f:
+        f.seek(len(memoryview(header).cast('B')))
+        f.write(bytes(range(256)) * 256)
+    return path
+
+
+@pytest.fixture
+def anonymized(pfile_path):
+    """
+    What the original anonymize_pfile made of pfile_path: the whole header
+    struct, anonymized, followed by the rest of the file unchanged.
+    """
+    with open(pfile_path, "rb") as f:
+        data = f.read()
+    header_cls = type(headers.Pfile.from_file(pfile_path).header)
+    header = header_cls.from_buffer_copy(data)
+    anonymizer.Anonymizer().anonymize(header)
+    return bytes(header) + data[ctypes.sizeof(header):]
@@ -0,0 +1,48 @@
+import asyncio
+import random
+
+import pytest
+
+from pfile_tools import aio, headers, synthetic
+
+
+def test_afrom_file(pfile_path, revision):
+    pfile = asyncio.run(headers.Pfile.afrom_file(pfile_path))
+    assert pfile.revision == revision
+    assert bytes(pfile.header) == bytes(
+        headers.Pfile.from_file(pfile_path).header)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = [str(tmp_path / ("P%05d.7" % i)) for i in range(20)]
+    for i, path in enumerate(paths):
+        synthetic.make_pfile(
+            path, "20.006", data_size=0, rng=random.Random(i),
+            exam_number=i)
+    return paths
+
+
+def collect(paths, **kwargs):
+    async def run():
+        return [r async for r in aio.iter_pfiles(paths, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_iter_pfiles(paths):
+    results = collect(iter(paths), concurrency=3)
+    assert sorted(r.path for r in results) == paths
+    for r in results:
+        assert r.error is None
+        assert r.pfile.exam_number == paths.index(r.path)
+
+
+def test_iter_pfiles_errors(tmp_path, paths):
+    missing = str(tmp_path / "missing.7")
+    results = collect(
+        paths[:2] + [missing], concurrency=2, return_exceptions=True)
+    errors = [r for r in results if r.error is not None]
+    assert [(r.path, r.pfile) for r in errors] == [(missing, None)]
+    assert isinstance(errors[0].error, FileNotFoundError)
+    with pytest.raises(FileNotFoundError):
+        collect([missing] + paths)
@@ -0,0 +1,117 @@
+import ctypes
+import io
+import mmap
+
+import pytest
+
+from pfile_tools import anonymizer, compression, headers
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_anonymize_stream_rejects_short_header(pfile_path):
+    data = read(pfile_path)
+    header_size = ctypes.sizeof(headers.Pfile.from_file(pfile_path).header)
+    for length in (100, header_size - 1):
+        out = io.BytesIO()
+        with pytest.raises(ValueError):
+            anonymizer.anonymize_stream(io.BytesIO(data[:length]), out)
+        assert out.getvalue() == b""
+
+
+def test_anonymized(pfile_path, anonymized):
+    assert anonymized != read(pfile_path)
+    pfile = headers.Pfile.from_file(io.BytesIO(anonymized))
+    assert pfile.patient_name == b"ANONYMIZED"
+    assert pfile.patient_age == 0
+
+
+@pytest.mark.parametrize("copy_mode", ["offload", "full"])
+def test_anonymize_file(tmp_path, pfile_path, copy_mode, anonymized):
+    out = str(tmp_path / "anon.7")
+    anonymizer.anonymize_file(pfile_path, out, copy_mode=copy_mode)
+    assert read(out) == anonymized
+
+
+def test_anonymize_file_inplace(pfile_path, anonymized):
+    anonymizer.anonymize_file(pfile_path)
+    assert read(pfile_path) == anonymized
+
+
+def test_anonymize_inplace(tmp_path, pfile_path, anonymized):
+    short = str(tmp_path / "short.7")
+    with open(short, "wb") as f:
+        f.write(read(pfile_path)[:100])
+    stats = anonymizer.anonymize_inplace([pfile_path, short])
+    assert (stats.files, stats.failed) == (1, 1)
+    assert read(pfile_path) == anonymized
+    assert len(read(short)) == 100
+
+
+def test_anonymize_stream(pfile_path, anonymized):
+    out = io.BytesIO()
+    anonymizer.anonymize_stream(
+        io.BytesIO(read(pfile_path)), out, bufsize=1000)
+    assert out.getvalue() == anonymized
+
+
+@pytest.mark.parametrize("codec", ["gzip", "bz2", "xz"])
+def test_anonymize_compressed(tmp_path, pfile_path, codec, anonymized):
+    compressed = str(tmp_path / "P00001.7.z")
+    with compression.open_compressed(compressed, codec) as f:
+        f.write(read(pfile_path))
+    out = str(tmp_path / "anon.7.z")
+    anonymizer.anonymize_file(compressed, out)
+    assert compression.codec_of(out) == codec
+    with compression.open_pfile(out) as f:
+        assert f.read() == anonymized
+    with pytest.raises(ValueError):
+        anonymizer.anonymize_file(compressed)
+
+
+def test_anonymize_compress(tmp_path, pfile_path, anonymized):
+    out = str(tmp_path / "anon.7.xz")
+    anonymizer.anonymize_file(pfile_path, out, compress="xz", threads=2)
+    assert compression.codec_of(out) == "xz"
+    with compression.open_pfile(out) as f:
+        assert f.read() == anonymized
+
+
+def test_script_refuses_same_path(monkeypatch, pfile_path):
+    from pfile_tools.scripts import anonymize_pfile
+    before = read(pfile_path)
+    monkeypatch.setattr(
+        "sys.argv", ["anonymize_pfile", pfile_path, pfile_path])
+    with pytest.raises(SystemExit):
+        anonymize_pfile.main()
+    assert read(pfile_path) == before
+
+
+def test_patch_file_maps_only_the_header(monkeypatch, tmp_path, pfile_path,
+        revision, anonymized):
+    lengths = []
+    real_mmap = mmap.mmap
+
+    def recording_mmap(fileno, length, **kwargs):
+        lengths.append(length)
+        return real_mmap(fileno, length, **kwargs)
+
+    monkeypatch.setattr(mmap, "mmap", recording_mmap)
+    with open(pfile_path, "ab") as f:
+        f.truncate(1 << 30)
+    anonymizer.patch_file(pfile_path, anonymizer.Anonymizer())
+    anonymizer.patch_file(
+        pfile_path, anonymizer.Anonymizer(), force_revision=revision)
+    assert lengths == [
+        headers.max_header_size(),
+        ctypes.sizeof(headers.header_class(revision))]
+    with open(pfile_path, "rb") as f:
+        assert f.read(len(anonymized)) == anonymized
+
+    empty = str(tmp_path / "empty.7")
+    open(empty, "wb").close()
+    stats = anonymizer.anonymize_inplace([empty])
+    assert (stats.files, stats.failed) == (0, 1)
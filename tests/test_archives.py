@@ -0,0 +1,88 @@
+import gzip
+import io
+import tarfile
+
+import pytest
+
+from pfile_tools import archives
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Pipe(io.RawIOBase):
+    """A stream that can't seek, like standard input or output."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, b):
+        return self.f.readinto(b)
+
+    def write(self, b):
+        return self.f.write(b)
+
+
+def add(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def make_tar(members, mode="w"):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode=mode) as tar:
+        for name, data in members:
+            add(tar, name, data)
+    return out.getvalue()
+
+
+def members(data):
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r") as tar:
+        return [(info.name, tar.extractfile(info).read())
+            for info in tar.getmembers()]
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz"])
+def test_anonymize_tar(pfile_path, anonymized, mode):
+    src = make_tar([
+        ("exam/P00001.7", read(pfile_path)),
+        ("exam/notes.txt", b"not a p-file"),
+        ("exam/P00002.7", read(pfile_path)),
+    ], mode)
+    dst = io.BytesIO()
+    names = archives.anonymize_tar(
+        Pipe(io.BytesIO(src)), Pipe(dst), bufsize=1000)
+    assert names == ["exam/P00001.7", "exam/P00002.7"]
+    assert members(dst.getvalue()) == [
+        ("exam/P00001.7", anonymized),
+        ("exam/notes.txt", b"not a p-file"),
+        ("exam/P00002.7", anonymized),
+    ]
+
+
+def test_anonymize_tar_rejects_compressed_member(pfile_path):
+    src = make_tar([("P00001.7.gz", gzip.compress(read(pfile_path)))])
+    with pytest.raises(ValueError):
+        archives.anonymize_tar(io.BytesIO(src), io.BytesIO())
+
+
+def test_scan_tar_stream(pfile_path, revision):
+    src = make_tar([
+        ("P00001.7", read(pfile_path)),
+        ("P00002.7.gz", gzip.compress(read(pfile_path))),
+        ("P00003.7", b"junk"),
+    ])
+    results = list(archives.scan_archive(Pipe(io.BytesIO(src))))
+    assert [r.path for r in results] == [
+        "-:P00001.7", "-:P00002.7.gz", "-:P00003.7"]
+    assert [r.revision for r in results[:2]] == [revision, revision]
+    assert results[2].error is not None
@@ -0,0 +1,60 @@
+import os
+import random
+
+from pfile_tools import batch_anonymizer, synthetic
+
+NAMES = ["P00001.7", "P00002.7", "P00003.7", os.path.join("a\tb", "P00004.7"),
+    os.path.join("c\\d", "P00005.7"), os.path.join("e\nf", "P00006.7")]
+
+
+def make_tree(root):
+    for i, name in enumerate(NAMES):
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        synthetic.make_pfile(
+            path, "20.006", data_size=4096, rng=random.Random(i))
+
+
+def run(src, dst, journal, stop_after=None):
+    results = {}
+    batch = batch_anonymizer.anonymize_tree(
+        src, dst, workers=2, journal_path=journal)
+    for result in batch:
+        assert result.error is None
+        results[os.path.relpath(result.src, src)] = result.skipped
+        if len(results) == stop_after:
+            # Stop, as an interrupted run would.
+            batch.close()
+            break
+    return results
+
+
+def test_resume(tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    journal = str(tmp_path / "journal")
+    make_tree(src)
+
+    first = run(src, dst, journal, stop_after=2)
+    assert sorted(first.values()) == [False, False]
+    # Die in the middle of writing another record.
+    with open(journal, "ab") as f:
+        f.write(b"P00003.7\t12")
+
+    second = run(src, dst, journal)
+    assert sorted(second) == sorted(NAMES)
+    assert sorted(name for name in second if second[name]) == sorted(first)
+    with open(journal, "rb") as f:
+        lines = f.read().split(b"\n")
+    assert lines[-1] == b""
+    assert len(lines) == len(NAMES) + 1
+
+    assert run(src, dst, journal) == dict((name, True) for name in NAMES)
+
+    # A changed source is done again.
+    changed = os.path.join(src, NAMES[3])
+    os.utime(changed, ns=(0, 0))
+    third = run(src, dst, journal)
+    assert [name for name in third if not third[name]] == [NAMES[3]]
+    assert batch_anonymizer.Journal(journal).is_done(
+        NAMES[3], os.stat(changed))
@@ -0,0 +1,71 @@
+import os
+import random
+
+import pytest
+
+from pfile_tools import catalog, synthetic
+
+
+def make(path, exam_number, mtime_ns):
+    synthetic.make_pfile(
+        path, "20.006", data_size=1024, rng=random.Random(exam_number),
+        exam_number=exam_number)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for d in ("a", "b"):
+        os.mkdir(str(tmp_path / d))
+    make(str(tmp_path / "a" / "P00001.7"), 1, 10**18)
+    make(str(tmp_path / "a" / "P00002.7"), 2, 10**18)
+    make(str(tmp_path / "b" / "P00003.7"), 3, 10**18)
+    with open(str(tmp_path / "a" / "P00004.7"), "wb") as f:
+        f.write(b"not a p-file")
+    return tmp_path
+
+
+def update(cat, tree, dirs=("a", "b"), **kwargs):
+    return cat.update([str(tree / d) for d in dirs], workers=2, **kwargs)
+
+
+def test_update(tree):
+    with catalog.Catalog(str(tree / "catalog.db")) as cat:
+        assert update(cat, tree) == (3, 0, 0, 0, 1)
+        # The unreadable file isn't retried until it changes.
+        assert update(cat, tree) == (0, 0, 4, 0, 0)
+
+        make(str(tree / "a" / "P00002.7"), 5, 2 * 10**18)
+        assert update(cat, tree) == (0, 1, 3, 0, 0)
+        exams = [row["exam_number"] for row in cat.query(
+            columns=["exam_number"], where="error IS NULL")]
+        assert exams == [1, 5, 3]
+
+        os.remove(str(tree / "a" / "P00001.7"))
+        os.remove(str(tree / "b" / "P00003.7"))
+        assert update(cat, tree, dirs=["a"]) == (0, 0, 2, 0, 0)
+        # Only files under the paths updated are pruned.
+        assert update(cat, tree, dirs=["a"], prune=True) == (0, 0, 2, 1, 0)
+        paths = [os.path.relpath(row["path"], str(tree))
+            for row in cat.query(columns=["path"])]
+        assert paths == [
+            os.path.join("a", "P00002.7"), os.path.join("a", "P00004.7"),
+            os.path.join("b", "P00003.7")]
+
+
+def test_query(tree):
+    db_path = str(tree / "catalog.db")
+    with catalog.Catalog(db_path) as cat:
+        update(cat, tree)
+    with catalog.Catalog(db_path) as cat:
+        assert {"path", "size", "mtime_ns", "revision", "error",
+            "exam_number", "patient_name"} <= set(cat.columns())
+        rows = list(cat.query(
+            "exam_number > ?", (1,), columns=["exam_number", "revision"],
+            order_by="exam_number DESC"))
+        assert rows == [
+            {"exam_number": 3, "revision": "20.006"},
+            {"exam_number": 2, "revision": "20.006"}]
+        errors = list(cat.query("error IS NOT NULL", columns=["path", "error"]))
+        assert len(errors) == 1
+        assert errors[0]["path"].endswith("P00004.7")
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pfile_tools import headers, synthetic
+
+
+def make(path, revision, data_offset=None):
+    header = synthetic.make_pfile(
+        path, revision, rng=random.Random(2), data_offset=data_offset,
+        slice_count=2, echo_count=1, frame_count=3, frame_size=8,
+        point_size=2)
+    size = synthetic.default_data_size(header)
+    offset = data_offset or synthetic.data_offset(header)
+    samples = np.arange(size // 2, dtype='<i2')
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(samples.tobytes())
+    return samples
+
+
+def test_raw_data(tmp_path, revision):
+    path = str(tmp_path / "P00001.7")
+    samples = make(path, revision)
+    pfile = headers.Pfile.from_file(path)
+    data = pfile.raw_data(data_offset=synthetic.data_offset(pfile.header))
+    assert data.shape == (synthetic.DEFAULT_RECEIVERS, 2, 1, 4, 8)
+    assert (data['real'].ravel() == samples[0::2]).all()
+
+
+def test_raw_data_needs_offset_or_receivers(tmp_path, revision):
+    path = str(tmp_path / "P00001.7")
+    make(path, revision)
+    pfile = headers.Pfile.from_file(path)
+    with pytest.raises(ValueError):
+        pfile.raw_data()
+    with pytest.raises(ValueError):
+        pfile.raw_data(receivers=synthetic.DEFAULT_RECEIVERS + 1000)
+
+
+def test_raw_data_offset(tmp_path, revision):
+    path = str(tmp_path / "P00001.7")
+    samples = make(path, revision, data_offset=262144)
+    pfile = headers.Pfile.from_file(path)
+    data = pfile.raw_data(data_offset=262144)
+    assert data.shape == (synthetic.DEFAULT_RECEIVERS, 2, 1, 4, 8)
+    assert (data['imag'].ravel() == samples[1::2]).all()
+    slices = list(pfile.iter_slices(data_offset=262144))
+    assert len(slices) == 2
+    assert slices[0][1][0, 0, 0, 1] == samples[2] + 1j * samples[3]
+
+
+def test_raw_data_receivers(tmp_path, revision):
+    path = str(tmp_path / "P00001.7")
+    samples = make(path, revision, data_offset=262144)
+    pfile = headers.Pfile.from_file(path)
+    data = pfile.raw_data(receivers=synthetic.DEFAULT_RECEIVERS)
+    assert (data['real'].ravel() == samples[0::2]).all()
@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pfile_tools import dtypes, headers
+
+
+def test_read_headers(pfile_path, revision):
+    out = dtypes.read_headers([pfile_path, pfile_path])
+    assert len(out) == 2
+    pfile = headers.Pfile.from_file(pfile_path)
+    assert out['revision'][0] == pfile.header.revision
+
+
+def test_read_headers_empty(revision):
+    out = dtypes.read_headers([], force_revision=revision)
+    assert len(out) == 0
+    assert out.dtype == dtypes.header_dtype(headers.header_class(revision))
+    with pytest.raises(ValueError):
+        dtypes.read_headers([])
+
+
+def test_read_headers_short_file(tmp_path, pfile_path):
+    short = str(tmp_path / "short.7")
+    with open(pfile_path, 'rb') as f, open(short, 'wb') as g:
+        g.write(f.read(100))
+    with pytest.raises(ValueError):
+        dtypes.read_headers([pfile_path, short])
@@ -0,0 +1,58 @@
+import os
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pfile_tools import export, synthetic
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = []
+    for i, revision in enumerate(["16", "26.002"]):
+        path = str(tmp_path / ("P0000%d.7" % (i + 1)))
+        synthetic.make_pfile(
+            path, revision, data_size=0, rng=random.Random(i),
+            exam_number=i + 1, series_timestamp=1000 * (i + 1))
+        paths.append(path)
+    junk = str(tmp_path / "P00003.7")
+    with open(junk, "wb") as f:
+        f.write(b"not a p-file")
+    return paths + [junk]
+
+
+def test_export_npz(tmp_path, paths):
+    out = str(tmp_path / "headers.npz")
+    assert export.export_headers(paths, out, workers=2) == (2, 1)
+    with np.load(out) as data:
+        assert set(data.files) == set(
+            name for name, dt in export.export_columns())
+        got = dict(zip(data["path"], zip(
+            data["revision"], data["exam_number"], data["series_timestamp"])))
+    assert got == {
+        paths[0]: ("16", 1, 0),
+        paths[1]: ("26.002", 2, 2000),
+    }
+
+
+def test_export_parquet(tmp_path, paths):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    out = str(tmp_path / "headers.parquet")
+    assert export.export_headers(paths, out, workers=2) == (2, 1)
+    table = parquet.read_table(out).to_pydict()
+    got = dict(zip(table["path"], zip(
+        table["revision"], table["exam_number"], table["series_timestamp"])))
+    # Fields a revision doesn't have are null.
+    assert got == {
+        paths[0]: ("16", 1, None),
+        paths[1]: ("26.002", 2, 2000),
+    }
+    assert isinstance(table["patient_name"][0], str)
+
+
+def test_export_unknown_format(tmp_path, paths):
+    with pytest.raises(ValueError):
+        export.export_headers(paths, str(tmp_path / "out"), format="csv")
+    assert not os.path.exists(str(tmp_path / "out"))
@@ -0,0 +1,160 @@
+import ctypes
+import gzip
+import io
+import shutil
+import struct
+import tarfile
+
+import pytest
+
+from pfile_tools import headers
+
+
+def test_from_file_revision(pfile_path, revision):
+    assert headers.Pfile.from_file(pfile_path).revision == revision
+
+
+def test_mmap_matches_read(pfile_path):
+    plain = headers.Pfile.from_file(pfile_path)
+    with headers.Pfile.from_file(pfile_path, use_mmap=True) as mapped:
+        assert mapped._mmap is not None
+        assert bytes(mapped.header) == bytes(plain.header)
+
+
+def test_mmap_falls_back_for_wrapped_streams(tmp_path, pfile_path, revision):
+    gz_path = str(tmp_path / "P00001.7.gz")
+    with open(pfile_path, "rb") as f, gzip.open(gz_path, "wb") as out:
+        shutil.copyfileobj(f, out)
+    with gzip.open(gz_path) as g:
+        assert headers.Pfile.from_file(g, use_mmap=True).revision == revision
+
+    tar_path = str(tmp_path / "p.tar")
+    with tarfile.open(tar_path, "w") as tar:
+        tar.add(pfile_path, "P00001.7")
+    with tarfile.open(tar_path) as tar:
+        member = tar.extractfile("P00001.7")
+        pfile = headers.Pfile.from_file(member, use_mmap=True)
+        assert pfile.revision == revision
+
+    with open(pfile_path, "rb") as f:
+        stream = io.BytesIO(f.read())
+    assert headers.Pfile.from_file(stream, use_mmap=True).revision == revision
+
+
+def test_fields_are_read_lazily(pfile_path):
+    pfile = headers.Pfile.from_file(pfile_path)
+    assert "exam_number" not in vars(pfile)
+    assert pfile.exam_number == pfile.header.exam_number
+    pfile.header.exam_number = 1234
+    assert pfile.exam_number == 1234
+    assert "exam_number" in dir(pfile)
+    with pytest.raises(AttributeError):
+        pfile.no_such_field
+
+
+def test_memoize(pfile_path):
+    pfile = headers.Pfile.from_file(pfile_path, memoize=True)
+    exam_number = pfile.exam_number
+    assert vars(pfile)["exam_number"] == exam_number
+    pfile.header.exam_number = exam_number + 1
+    assert pfile.exam_number == exam_number
+
+
+class Unpeekable(object):
+    """A stream with nothing but read()."""
+
+    def __init__(self, data):
+        self.f = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+
+def test_from_file_without_peek(pfile_path, revision):
+    with open(pfile_path, "rb") as f:
+        data = f.read()
+    pfile = headers.Pfile.from_file(Unpeekable(data))
+    assert pfile.revision == revision
+    assert bytes(pfile.header) == data[:len(bytes(pfile.header))]
+    with pytest.raises(ValueError):
+        headers.Pfile.from_file(Unpeekable(data[:len(bytes(pfile.header)) - 1]))
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Lets a test register revisions without leaving them registered."""
+    monkeypatch.setattr(
+        headers, "_REVISION_REGISTRY", dict(headers._REVISION_REGISTRY))
+    monkeypatch.setattr(headers, "_SNIFF_CACHE", {})
+    monkeypatch.setattr(headers, "_HEADER_SIZES", list(headers._HEADER_SIZES))
+
+
+def test_register_revision(tmp_path, registry):
+    class R99PfileHeader(headers.R16PfileHeader):
+        _fields_ = [('extra', ctypes.c_int)]
+
+    assert "99.5" not in headers.known_revisions()
+    headers.register_revision("99.5", R99PfileHeader)
+    assert "99.5" in headers.known_revisions()
+    assert headers.header_class("99.5") is R99PfileHeader
+
+    header = R99PfileHeader(revision=99.5, extra=7)
+    path = str(tmp_path / "P00001.7")
+    with open(path, "wb") as f:
+        f.write(header)
+    for use_mmap in (False, True):
+        pfile = headers.Pfile.from_file(path, use_mmap=use_mmap)
+        assert pfile.revision == "99.5"
+        assert pfile.extra == 7
+        pfile.close()
+
+
+def test_sniff_cache_skips_unknown_revisions(registry):
+    assert headers.sniff_revision(struct.pack("<f", 26.002)) == "26.002"
+    assert headers.sniff_revision(b"junk") not in headers.known_revisions()
+    assert list(headers._SNIFF_CACHE.values()) == ["26.002"]
+    with pytest.raises(headers.UnknownRevision):
+        headers.sniff_revision(b"ju")
+
+
+READ_FIELDS = ["exam_number", "patient_id", "tr"]
+
+
+def read_all_fields(path):
+    pfile = headers.Pfile.from_file(path)
+    return dict((name, getattr(pfile, name)) for name in READ_FIELDS)
+
+
+def test_read_fields(pfile_path, revision):
+    values = headers.read_fields(pfile_path, READ_FIELDS)
+    assert values == read_all_fields(pfile_path)
+    assert values["exam_number"] != 0
+    assert headers.read_fields(
+        pfile_path, READ_FIELDS, force_revision=revision, max_gap=0) == values
+    with open(pfile_path, "rb") as f:
+        assert headers.read_fields(f, READ_FIELDS) == values
+    with pytest.raises(AttributeError):
+        headers.read_fields(pfile_path, ["no_such_field"])
+
+
+def test_read_fields_short_file(tmp_path, pfile_path, revision):
+    short = str(tmp_path / "short.7")
+    with open(pfile_path, "rb") as f, open(short, "wb") as out:
+        out.write(f.read(2000))
+    with pytest.raises(ValueError):
+        headers.read_fields(short, READ_FIELDS)
+    with pytest.raises(ValueError):
+        headers.read_fields(short, READ_FIELDS, force_revision=revision)
+
+
+def test_read_fields_compressed(tmp_path, pfile_path, revision):
+    gz_path = str(tmp_path / "P00001.7.gz")
+    with open(pfile_path, "rb") as f, gzip.open(gz_path, "wb") as out:
+        shutil.copyfileobj(f, out)
+    values = read_all_fields(pfile_path)
+    assert headers.read_fields(gz_path, READ_FIELDS) == values
+    assert headers.read_fields(
+        gz_path, READ_FIELDS, force_revision=revision) == values
+    with open(gz_path, "rb") as f:
+        with pytest.raises(ValueError):
+            headers.read_fields(f, READ_FIELDS)
@@ -0,0 +1,41 @@
+import pytest
+
+from pfile_tools import instrumentation, scanner
+
+
+@pytest.fixture
+def profiling():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_timed_generator(profiling):
+    @instrumentation.timed("test.gen")
+    def gen():
+        yield 1
+        yield 2
+
+    assert list(gen()) == [1, 2]
+    assert instrumentation.report()["test.gen"]["count"] == 1
+
+
+def test_disabled_records_nothing():
+    instrumentation.reset()
+
+    @instrumentation.timed("test.off")
+    def f():
+        return 3
+
+    assert f() == 3
+    assert instrumentation.report() == {}
+
+
+def test_pool_map_merges_worker_timings(profiling, pfile_path):
+    results = list(scanner.scan([pfile_path, pfile_path], workers=2))
+    assert all(r.error is None for r in results)
+    report = instrumentation.report()
+    assert report["pfile.from_file"]["count"] == 2
+    assert report["struct.iter_struct"]["count"] == 2
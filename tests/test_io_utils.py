@@ -0,0 +1,56 @@
+import shutil
+
+import pytest
+
+from pfile_tools import anonymizer, io_utils
+
+
+def test_copy_file(tmp_path, pfile_path):
+    dst = str(tmp_path / "copy.7")
+    io_utils.copy_file(pfile_path, dst)
+    with open(pfile_path, "rb") as a, open(dst, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_copy_file_refuses_same_file(pfile_path):
+    with open(pfile_path, "rb") as f:
+        before = f.read()
+    with pytest.raises(shutil.SameFileError):
+        io_utils.copy_file(pfile_path, pfile_path)
+    with open(pfile_path, "rb") as f:
+        assert f.read() == before
+
+
+def test_anonymize_file_refuses_same_path(pfile_path):
+    with open(pfile_path, "rb") as f:
+        before = f.read()
+    for copy_mode in ("offload", "full"):
+        with pytest.raises(shutil.SameFileError):
+            anonymizer.anonymize_file(
+                pfile_path, pfile_path, copy_mode=copy_mode)
+    with open(pfile_path, "rb") as f:
+        assert f.read() == before
+
+
+def test_parse_size():
+    assert io_utils.parse_size("4096") == 4096
+    assert io_utils.parse_size("512K") == 512 << 10
+    assert io_utils.parse_size("2gb") == 2 << 30
+    with pytest.raises(ValueError):
+        io_utils.parse_size("x")
+
+
+def test_replacing(tmp_path):
+    path = str(tmp_path / "out.7")
+    with io_utils.replacing(path) as f:
+        f.write(b"done")
+    with open(path, "rb") as f:
+        assert f.read() == b"done"
+
+    with pytest.raises(RuntimeError):
+        with io_utils.replacing(path) as f:
+            f.write(b"partial")
+            raise RuntimeError()
+    with open(path, "rb") as f:
+        assert f.read() == b"done"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.7"]
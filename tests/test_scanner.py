@@ -0,0 +1,28 @@
+import gzip
+import os
+import shutil
+
+from pfile_tools import scanner
+
+
+def test_find_pfiles_finds_compressed(tmp_path, pfile_path):
+    gz_path = str(tmp_path / "P00002.7.gz")
+    with open(pfile_path, "rb") as f, gzip.open(gz_path, "wb") as out:
+        shutil.copyfileobj(f, out)
+    # Named like a compressed p-file, but isn't compressed.
+    with open(str(tmp_path / "P00003.7.gz"), "wb") as f:
+        f.write(b"not gzip")
+    with open(str(tmp_path / "notes.txt"), "wb") as f:
+        f.write(b"hi")
+
+    found = [os.path.basename(p) for p in scanner.find_pfiles([str(tmp_path)])]
+    assert found == ["P00001.7", "P00002.7.gz"]
+    found = scanner.find_pfiles([str(tmp_path)], compressed=False)
+    assert [os.path.basename(p) for p in found] == ["P00001.7"]
+
+
+def test_scan_header(pfile_path, revision):
+    result = scanner.scan_header(pfile_path, fields=["exam_number"])
+    assert result.error is None
+    assert result.revision == revision
+    assert [label for label, value in result.values] == ["exam_number"]
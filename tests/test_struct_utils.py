@@ -0,0 +1,121 @@
+import ctypes
+
+import pytest
+
+from pfile_tools import headers, struct_utils
+
+
+class Inner(ctypes.LittleEndianStructure):
+    _pack_ = 1
+    _fields_ = [
+        ('code', ctypes.c_short),
+        ('name', ctypes.c_char * 8),
+    ]
+
+
+class Outer(ctypes.LittleEndianStructure):
+    _pack_ = 1
+    _fields_ = [
+        ('revision', ctypes.c_float),
+        ('pad_1', ctypes.c_char * 4),
+        ('inner', Inner),
+        ('count', ctypes.c_int),
+    ]
+
+
+def test_compile_accessor():
+    accessor = struct_utils.compile_accessor(Outer, "inner.name")
+    assert (accessor.offset, accessor.size) == (10, 8)
+    assert struct_utils.compile_accessor(Outer, "inner.name") is accessor
+    with pytest.raises(AttributeError):
+        struct_utils.compile_accessor(Outer, "inner.nope")
+    with pytest.raises(AttributeError):
+        struct_utils.compile_accessor(Outer, "count.nope")
+
+
+def test_get_and_set_struct_value():
+    s = Outer()
+    s.inner.name = b"longname"
+    struct_utils.set_struct_value(s, "inner.name", "abc")
+    assert s.inner.name == b"abc"
+    assert bytes(s)[10:18] == b"abc\0\0\0\0\0"
+    struct_utils.set_struct_value(s, "inner.code", -2)
+    struct_utils.set_struct_value(s, "revision", 26.002)
+    assert s.inner.code == -2
+    assert struct_utils.get_struct_value(s, "inner.code") == -2
+    assert struct_utils.get_struct_value(s, "revision") == pytest.approx(26.002)
+    assert struct_utils.get_struct_value(s, "inner.name") == b"abc"
+
+
+def test_has_struct_value():
+    s = Outer()
+    assert struct_utils.has_struct_value(s, "inner.code")
+    assert not struct_utils.has_struct_value(s, "inner.nope")
+
+
+def test_dirty_ranges():
+    s = Outer()
+    dirty = struct_utils.DirtyRanges()
+    struct_utils.set_struct_value(s, "count", 3, dirty)
+    struct_utils.set_struct_value(s, "inner.code", 1, dirty)
+    struct_utils.set_struct_value(s, "inner.name", b"x", dirty)
+    assert len(dirty) == 3
+    assert list(dirty) == [(8, 22)]
+    assert struct_utils.coalesce_ranges([(0, 2), (5, 6)], gap=3) == [(0, 6)]
+    assert struct_utils.coalesce_ranges([(5, 6), (0, 2)]) == [(0, 2), (5, 6)]
+
+
+def walk(struct_class, prefix="", base=0):
+    """The (label, offset, size) of each field, worked out the slow way."""
+    for f in struct_class._fields_:
+        name, field_type = f[0], f[1]
+        field = getattr(struct_class, name)
+        if issubclass(field_type, ctypes.Structure):
+            for row in walk(field_type, prefix + name + ".",
+                    base + field.offset):
+                yield row
+        else:
+            yield prefix + name, base + field.offset, field.size
+
+
+def test_struct_layout():
+    layout = struct_utils.struct_layout(Outer)
+    assert struct_utils.struct_layout(Outer) is layout
+    assert [(r.label, r.offset, r.size) for r in layout] == list(walk(Outer))
+    assert [r.is_padding for r in layout] == [False, True, False, False, False]
+    assert [r.is_bytes for r in layout] == [False, True, False, True, False]
+    with_structs = struct_utils.struct_layout(Outer, include_structs=True)
+    assert [r.label for r in with_structs if r.accessor is None] == [
+        " (Outer)", "inner. (Inner)"]
+
+
+def test_struct_layout_headers(revision):
+    header_cls = headers.header_class(revision)
+    layout = struct_utils.struct_layout(header_cls)
+    assert [(r.label, r.offset, r.size) for r in layout] == list(
+        walk(header_cls))
+
+
+def test_iter_struct():
+    s = Outer(revision=26.0, count=7)
+    s.inner.name = b"ab"
+    rows = list(struct_utils.iter_struct(s))
+    assert rows == struct_utils.dump_struct(s)
+    assert [(r.label, r.value) for r in rows] == [
+        ("revision", 26.0), ("pad_1", b""), ("inner.code", 0),
+        ("inner.name", b"ab"), ("count", 7)]
+    assert [r.label for r in struct_utils.iter_struct(
+        s, skip_padding=True)] == [
+            "revision", "inner.code", "inner.name", "count"]
+    assert [r.label for r in struct_utils.iter_struct(
+        s, include=["inner.*", "count"], exclude=["*.code"])] == [
+            "inner.name", "count"]
+    assert list(struct_utils.iter_struct(s, include=[])) == []
+
+
+def test_iter_struct_is_lazy():
+    s = Outer()
+    rows = struct_utils.iter_struct(s)
+    assert next(rows).label == "revision"
+    s.count = 5
+    assert [r.value for r in rows][-1] == 5
@@ -0,0 +1,52 @@
+import ctypes
+import os
+import random
+
+import pytest
+
+from pfile_tools import anonymizer, headers, synthetic
+
+
+@pytest.mark.parametrize("revision", headers.known_revisions())
+def test_make_pfile(tmp_path, revision):
+    path = str(tmp_path / "P00001.7")
+    header = synthetic.make_pfile(
+        path, revision, rng=random.Random(0), exam_number=42)
+    pfile = headers.Pfile.from_file(path)
+    assert pfile.revision == revision
+    assert bytes(pfile.header) == bytes(header)
+    assert pfile.exam_number == 42
+    assert pfile.patient_name != b""
+    assert os.path.getsize(path) == (
+        ctypes.sizeof(header) + synthetic.default_data_size(header))
+    if hasattr(pfile.header, "data_size"):
+        assert pfile.data_size == synthetic.default_data_size(header)
+    # Every field the anonymizer clears is filled in.
+    for entry in anonymizer.DEFAULT_LIST:
+        if hasattr(pfile.header, entry.key):
+            value = entry.value
+            if isinstance(value, str):
+                value = value.encode('ascii')
+            assert getattr(pfile, entry.key) != value
+
+
+def test_make_pfile_repeatable(tmp_path):
+    a = synthetic.make_pfile(str(tmp_path / "a.7"), rng=random.Random(5))
+    b = synthetic.make_pfile(str(tmp_path / "b.7"), rng=random.Random(5))
+    assert bytes(a) == bytes(b)
+
+
+def test_make_corpus(tmp_path):
+    revisions = headers.known_revisions()
+    count = len(revisions) + 2
+    paths = synthetic.make_corpus(
+        str(tmp_path / "corpus"), count, data_size=100, seed=3)
+    assert [os.path.basename(p) for p in paths] == [
+        "P%05d.7" % (i + 1) for i in range(count)]
+    assert [headers.Pfile.from_file(p).revision for p in paths] == (
+        revisions + revisions[:2])
+    again = synthetic.make_corpus(
+        str(tmp_path / "again"), count, data_size=100, seed=3)
+    for a, b in zip(paths, again):
+        with open(a, "rb") as f, open(b, "rb") as g:
+            assert f.read() == g.read()